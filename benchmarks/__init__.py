@@ -0,0 +1,10 @@
+"""
+Benchmarks for the USX splitter
+
+The corpus module generates synthetic USX books with matching TOCs, the
+stages module times each stage of a split on them and the complexity module
+checks that the work of a split grows linearly with the book. Run the suite
+with:
+
+    python -m dbl2writersrc.benchmarks
+"""
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Command-line interface for the USX splitter benchmarks
+"""
+
+import sys
+from pathlib import Path
+
+# Add the directory above the package to the path so we can import it
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from dbl2writersrc.benchmarks.corpus import SIZES, write_book
+from dbl2writersrc.benchmarks.stages import run_benchmarks, format_results
+from dbl2writersrc.benchmarks.complexity import AXES, check_growth, format_growth
+
+
+def run_main(argv):
+    """Time the stages of splitting synthetic books."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog='dbl2writersrc.benchmarks',
+        description='Time each stage of splitting synthetic USX books, from one chapter up to a whole Bible',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=f"""
+Sizes: {', '.join(SIZES)}
+
+Examples:
+  # Time every size
+  python -m dbl2writersrc.benchmarks
+
+  # Time small books only, five runs each
+  python -m dbl2writersrc.benchmarks --sizes chapter,book --repeat 5
+
+  # Check that the work of every engine grows linearly with the book (see: complexity --help)
+  python -m dbl2writersrc.benchmarks complexity
+
+  # Write a synthetic book and its TOC for other experiments (see: generate --help)
+  python -m dbl2writersrc.benchmarks generate corpus/ --chapters 150 --verses 17
+        """
+    )
+    parser.add_argument('--sizes', default=','.join(SIZES),
+                        help='Comma-separated sizes to time (default: all)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Runs per size; the fastest time of each stage is reported (default: 3)')
+    parser.add_argument('--xml-backend', choices=['lxml', 'stdlib'], default='stdlib',
+                        help='XML library to use (default: stdlib)')
+    parser.add_argument('--work-dir',
+                        help='Directory to generate the books and their output in, kept afterwards '
+                             '(default: a temporary directory)')
+
+    args = parser.parse_args(argv)
+
+    sizes = args.sizes.split(',')
+    unknown = [size for size in sizes if size not in SIZES]
+    if unknown:
+        print(f"Error: Unknown sizes: {', '.join(unknown)}")
+        sys.exit(1)
+
+    try:
+        results = run_benchmarks(sizes, repeat=args.repeat, backend=args.xml_backend, work_dir=args.work_dir)
+    except Exception as e:
+        print(f"Error during benchmark: {e}")
+        sys.exit(1)
+    print(format_results(results))
+
+
+def generate_main(argv):
+    """Write a synthetic USX book and its TOC."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog='dbl2writersrc.benchmarks generate',
+        description='Write a synthetic USX book as <CODE>.usx with its TOC as <CODE>.yml'
+    )
+    parser.add_argument('output_dir', help='Directory to write the book and TOC into')
+    parser.add_argument('--size', choices=list(SIZES), help='Start from the chapter and verse counts of a size')
+    parser.add_argument('--chapters', type=int, help='Number of chapters (default: 22)')
+    parser.add_argument('--verses', type=int, help='Verses per chapter (default: 25)')
+    parser.add_argument('--notes', type=float, help='Average footnotes per verse (default: 0.3)')
+    parser.add_argument('--verses-per-para', type=float, help='Average verses per paragraph (default: 2.0)')
+    parser.add_argument('--chunk-verses', type=int, help='Verses per chunk in the TOC (default: 3)')
+    parser.add_argument('--book-code', help='Book code (default: TST)')
+    parser.add_argument('--seed', type=int, help='Random seed; the same seed gives the same book (default: 0)')
+
+    args = parser.parse_args(argv)
+
+    options = {name: value for name, value in vars(args).items()
+               if name not in ('output_dir', 'size') and value is not None}
+    usx_path, toc_path = write_book(args.output_dir, size=args.size, **options)
+    print(f"Created: {usx_path}")
+    print(f"Created: {toc_path}")
+
+
+def complexity_main(argv):
+    """Check that the work counts of a split grow linearly with the book."""
+    import argparse
+    from dbl2writersrc.usx_splitter import ENGINES
+
+    parser = argparse.ArgumentParser(
+        prog='dbl2writersrc.benchmarks complexity',
+        description='Split synthetic books of doubling size and fail if the elements visited, '
+                    'paragraphs copied or bytes serialized grow faster than the book'
+    )
+    parser.add_argument('--engines', default=','.join(ENGINES),
+                        help='Comma-separated engines to check (default: all)')
+    parser.add_argument('--axes', default=','.join(AXES),
+                        help='Comma-separated axes to grow the book along: chapters, verses (default: both)')
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help='How much more than double a count may grow when the book doubles (default: 0.15)')
+
+    args = parser.parse_args(argv)
+
+    engines = args.engines.split(',')
+    axes = args.axes.split(',')
+    unknown = [name for name in engines if name not in ENGINES] + [name for name in axes if name not in AXES]
+    if unknown:
+        print(f"Error: Unknown engines or axes: {', '.join(unknown)}")
+        sys.exit(1)
+
+    results = check_growth(engines, axes, tolerance=args.tolerance)
+    print(format_growth(results))
+    if not all(result['linear'] for result in results):
+        print("Error: Work grows faster than linearly with the book")
+        sys.exit(1)
+
+
+COMMANDS = {
+    'complexity': complexity_main,
+    'generate': generate_main,
+}
+
+
+def main():
+    """Main CLI function."""
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        COMMANDS[sys.argv[1]](sys.argv[2:])
+    else:
+        run_main(sys.argv[1:])
+
+
+if __name__ == "__main__":
+    main()
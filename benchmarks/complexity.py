@@ -0,0 +1,78 @@
+"""
+Complexity checks
+
+Splits synthetic books of doubling size and checks that the work counters
+of usx_splitter grow linearly with them. A per-chapter or per-chunk rescan
+of the book makes some count grow faster, which a timing benchmark on a
+small book would not show.
+"""
+
+from dbl2writersrc.usx_splitter import WORK_COUNTERS, WorkCounters, ENGINES, get_backend, split
+from dbl2writersrc.benchmarks.corpus import generate_book
+
+# Books that double along each axis: more chapters, and longer chapters
+# with more chunks each
+AXES = {
+    'chapters': [{'chapters': chapters, 'verses': 25} for chapters in (8, 16, 32, 64)],
+    'verses': [{'chapters': 4, 'verses': verses} for verses in (25, 50, 100, 200)],
+}
+
+
+def count_work(options, engine='dom'):
+    """Split a synthetic book built with the given generate_book options and return the work counts."""
+    data, toc = generate_book(**options)
+    WORK_COUNTERS.reset()
+    for _ in split(data, toc, engine=engine, backend=get_backend('stdlib')):
+        pass
+    return WORK_COUNTERS.snapshot()
+
+
+def check_growth(engines=None, axes=None, tolerance=0.15):
+    """Check that the work counts grow linearly along each axis.
+
+    A count may at most double, give or take tolerance, when the book
+    doubles. Returns a list of result dicts, one per engine, axis and book
+    size, each with the counts, the growth of each count over the previous
+    size and whether that growth was linear.
+    """
+    engines = engines or list(ENGINES)
+    axes = axes or list(AXES)
+    limit = 2 * (1 + tolerance)
+
+    results = []
+    for engine in engines:
+        for axis in axes:
+            previous = None
+            for options in AXES[axis]:
+                counts = count_work(options, engine)
+                growth = {}
+                if previous is not None:
+                    growth = {name: counts[name] / previous[name] if previous[name] else 0.0
+                              for name in WorkCounters.NAMES}
+                results.append({
+                    'engine': engine,
+                    'axis': axis,
+                    'size': options[axis],
+                    'counts': counts,
+                    'growth': growth,
+                    'linear': all(ratio <= limit for ratio in growth.values()),
+                })
+                previous = counts
+
+    return results
+
+
+def format_growth(results):
+    """Format complexity results as a table with the counts and their growth over the previous size."""
+    header = ['engine', 'axis', 'size'] + WorkCounters.NAMES + ['growth', '']
+    rows = []
+    for result in results:
+        growth = result['growth']
+        rows.append([result['engine'], result['axis'], str(result['size'])] +
+                    [str(result['counts'][name]) for name in WorkCounters.NAMES] +
+                    ['/'.join(f"{growth[name]:.2f}" for name in WorkCounters.NAMES) if growth else '-',
+                     '' if result['linear'] else 'FAIL'])
+
+    widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+    lines = ['  '.join(cell.rjust(width) for cell, width in zip(row, widths)).rstrip() for row in [header] + rows]
+    return '\n'.join(lines)
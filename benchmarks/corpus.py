@@ -0,0 +1,109 @@
+"""
+Synthetic USX corpus
+
+Generates USX books shaped like real DBL releases - a front matter, section
+headings, prose and poetry paragraphs, footnotes - together with a TOC that
+chunks every chapter, so benchmarks can run on any book size.
+"""
+
+import random
+from pathlib import Path
+
+import yaml
+
+# Book shapes from a single chapter up to the whole Bible in one book
+SIZES = {
+    'chapter': {'chapters': 1, 'verses': 25},
+    'book': {'chapters': 22, 'verses': 25},
+    'psalms': {'chapters': 150, 'verses': 17},
+    'bible': {'chapters': 1189, 'verses': 26},
+}
+
+# Verse text is drawn from these words, including some non-ASCII ones
+WORDS = [
+    'and', 'the', 'word', 'light', 'people', 'city', 'water', 'spoke', 'came', 'went',
+    'heaven', 'earth', 'servant', 'voice', 'throne', 'gate', 'river', 'tree', 'sea', 'day',
+    'night', 'sat', 'saw', 'heard', 'called', 'gave', 'name', 'house', 'land', 'king',
+    'thành', 'người', 'ánh sáng', 'tiếng nói', 'dòng sông',
+]
+
+
+def generate_book(chapters=22, verses=25, notes=0.3, verses_per_para=2.0, chunk_verses=3,
+                  book_code='TST', seed=0):
+    """Generate a synthetic USX book and its TOC.
+
+    chapters and verses set the size of the book, notes the average number of
+    footnotes per verse, verses_per_para the average paragraph length and
+    chunk_verses the number of verses per chunk in the TOC. The same seed
+    always gives the same book. Returns the USX bytes and the TOC list.
+    """
+    rng = random.Random(seed)
+    lines = [
+        '<?xml version="1.0" encoding="utf-8"?>',
+        '<usx version="3.0">',
+        f'  <book code="{book_code}" style="id">- Synthetic benchmark book</book>',
+        '  <para style="h">Synthetic</para>',
+        '  <para style="toc1">The Synthetic Book &amp; Notes</para>',
+        '  <para style="toc2">Synthetic</para>',
+        f'  <para style="toc3">{book_code}</para>',
+        '  <para style="mt1">THE SYNTHETIC BOOK</para>',
+    ]
+    toc = [{'chapter': 'front', 'chunks': ['title']}]
+
+    for chapter in range(1, chapters + 1):
+        lines.append(f'  <chapter number="{chapter}" style="c" sid="{book_code} {chapter}" />')
+        lines.append(f'  <para style="s1">Heading {chapter}</para>')
+        verse = 1
+        while verse <= verses:
+            # Paragraph lengths vary around verses_per_para
+            count = max(1, round(rng.uniform(0.5, 1.5) * verses_per_para))
+            style = 'q1' if rng.random() < 0.2 else 'p'
+            parts = []
+            for verse in range(verse, min(verse + count, verses + 1)):
+                parts.append(_verse(rng, book_code, chapter, verse, notes))
+            lines.append(f'  <para style="{style}">' + ''.join(parts) + '</para>')
+            verse += 1
+            if rng.random() < 0.05 and verse <= verses:
+                lines.append('  <para style="s2">Section heading</para>')
+        lines.append(f'  <chapter eid="{book_code} {chapter}" />')
+
+        starts = [f'{start:02d}' for start in range(1, verses + 1, chunk_verses)]
+        toc.append({'chapter': f'{chapter:02d}', 'chunks': ['title'] + starts})
+
+    lines.append('</usx>')
+    return ('\n'.join(lines) + '\n').encode('utf-8'), toc
+
+
+def _verse(rng, book_code, chapter, verse, notes):
+    """Return the markup of one verse with its footnotes."""
+    # The fractional part of notes is the chance of one more footnote
+    count = int(notes) + (1 if rng.random() < notes - int(notes) else 0)
+    footnotes = ''.join(
+        f'<note caller="+" style="f"><char style="fr">{chapter}:{verse} </char>'
+        f'<char style="ft">Footnote &lt;{i + 1}&gt; on this verse.</char></note>'
+        for i in range(count)
+    )
+    words = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(8, 24)))
+    return (f'<verse number="{verse}" style="v" sid="{book_code} {chapter}:{verse}" />'
+            f'{words.capitalize()}{footnotes} {rng.choice(WORDS)}.'
+            f'<verse eid="{book_code} {chapter}:{verse}" />')
+
+
+def write_book(directory, size=None, **options):
+    """Write a synthetic book into directory as <CODE>.usx and <CODE>.yml.
+
+    size names one of SIZES, and options are passed on to generate_book,
+    overriding the size. Returns the paths of the USX and TOC files.
+    """
+    options = dict(SIZES[size] if size else {}, **options)
+    data, toc = generate_book(**options)
+    book_code = options.get('book_code', 'TST')
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    usx_path = directory / f"{book_code}.usx"
+    toc_path = directory / f"{book_code}.yml"
+    usx_path.write_bytes(data)
+    with open(toc_path, 'w', encoding='utf-8') as f:
+        yaml.safe_dump(toc, f, default_flow_style=False, sort_keys=False)
+    return usx_path, toc_path
@@ -0,0 +1,101 @@
+"""
+Stage benchmarks
+
+Splits synthetic books with USXSplitter and times each stage of the split
+separately with StageTimer, so a change to one stage shows up in that
+stage's timing.
+"""
+
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from dbl2writersrc.usx_splitter import get_backend, StageTimer, USXSplitter, _discard_log
+from dbl2writersrc.benchmarks.corpus import SIZES, write_book
+
+# The StageTimer stages each benchmark stage adds up, and those nested in
+# them that it leaves out, since StageTimer times are inclusive. USXWriter
+# indents the documents while it serializes them, so indentation is timed
+# as part of serialize. other is the rest of the run.
+STAGE_TIMERS = {
+    'load_toc': (['load_toc'], []),
+    'parse': (['load_usx'], ['build_chapter_index']),
+    'index': (['build_chapter_index'], []),
+    'extract_chapter': (['extract_chapter_content'], []),
+    'extract_chunks': (['extract_chunks', 'extract_title_content'], []),
+    'serialize': (['render_document'], []),
+    'write': (['write_output'], []),
+}
+STAGES = list(STAGE_TIMERS) + ['other']
+
+
+def time_stages(usx_path, toc_path, output_dir, backend='stdlib'):
+    """Split a book once with USXSplitter.run under a StageTimer and return the seconds spent in each stage."""
+    splitter = USXSplitter(usx_path, toc_path, output_dir, backend=get_backend(backend), incremental=False,
+                           log=_discard_log)
+    stage_timer = StageTimer()
+    stage_timer.instrument(splitter)
+
+    start = time.perf_counter()
+    splitter.run()
+    total = time.perf_counter() - start
+
+    seconds = dict.fromkeys(StageTimer.STAGES, 0.0)
+    for stage, _, duration in stage_timer.records:
+        seconds[stage] += duration
+    timings = {stage: sum(seconds[name] for name in added) - sum(seconds[name] for name in nested)
+               for stage, (added, nested) in STAGE_TIMERS.items()}
+    timings['other'] = total - sum(timings.values())
+    return timings
+
+
+def run_benchmarks(sizes=None, repeat=3, backend='stdlib', work_dir=None):
+    """Time the stages of splitting a synthetic book of each size.
+
+    Each book is split repeat times and the fastest time of every stage is
+    kept. Books are generated in work_dir, or in a temporary directory that
+    is removed afterwards. Returns a list of result dicts, one per size.
+    """
+    sizes = sizes or list(SIZES)
+    temp_dir = None
+    if work_dir is None:
+        work_dir = temp_dir = tempfile.mkdtemp(prefix='usx-bench-')
+    work_dir = Path(work_dir)
+
+    results = []
+    try:
+        for size in sizes:
+            usx_path, toc_path = write_book(work_dir / size, size=size)
+            best = None
+            for _ in range(repeat):
+                timings = time_stages(usx_path, toc_path, work_dir / size / 'output', backend=backend)
+                best = timings if best is None else {stage: min(best[stage], timings[stage]) for stage in STAGES}
+            results.append({
+                'size': size,
+                'chapters': SIZES[size]['chapters'],
+                'verses': SIZES[size]['chapters'] * SIZES[size]['verses'],
+                'bytes': usx_path.stat().st_size,
+                'timings': best,
+            })
+    finally:
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    return results
+
+
+def format_results(results):
+    """Format benchmark results as a table with one row per size and one column per stage, in ms."""
+    header = ['size', 'chapters', 'verses', 'KB'] + STAGES + ['total']
+    rows = []
+    for result in results:
+        timings = result['timings']
+        rows.append([result['size'], str(result['chapters']), str(result['verses']),
+                     str(result['bytes'] // 1024)] +
+                    [f"{timings[stage] * 1000:.1f}" for stage in STAGES] +
+                    [f"{sum(timings.values()) * 1000:.1f}"])
+
+    widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+    lines = ['  '.join(cell.rjust(width) for cell, width in zip(row, widths)) for row in [header] + rows]
+    return '\n'.join(lines)
@@ -5,16 +5,71 @@ Command-line interface for DBL to Writer Source converter
 
 import sys
 import os
+import contextlib
+import json
+import zipfile
 from pathlib import Path
 
 # Add the parent directory to the path so we can import our module
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from dbl2writersrc.usx_splitter import USXSplitter
+from dbl2writersrc.usx_splitter import (
+    ENGINES, get_backend, find_release_books, split_books, make_cache, compile_toc, serve, extract_chunk,
+    Selection, find_multibook_books, split_multibook, StageTimer, MemoryTracker, Profiler
+)
 
+DEFAULT_BOOK_CODE = 'REV'
+DEFAULT_BOOK_TITLE = '- Biblica® Open Vietnamese Contemporary Bible 2015 (Biblica® Thiên Ban Kinh Thánh Hiện Đại)'
 
-def main():
-    """Main CLI function."""
+
+def add_profile_arguments(parser):
+    """Add the --profile options shared by the converting commands."""
+    parser.add_argument('--profile', metavar='FILE',
+                       help='Profile the conversion into FILE for pstats or snakeviz and print the top hotspots; '
+                            'worker processes write FILE.<pid> profiles next to it')
+    parser.add_argument('--profile-mode', choices=Profiler.MODES, default='cprofile',
+                       help='cprofile traces every call, sample records the stack on a CPU timer at a far '
+                            'lower cost (Unix only) (default: cprofile)')
+    parser.add_argument('--profile-interval', type=float, default=1.0,
+                       help='Milliseconds of CPU time between samples in sample mode (default: 1)')
+
+
+def make_profiler(args):
+    """Return the Profiler the --profile options ask for, or None."""
+    if not args.profile:
+        return None
+    return Profiler(args.profile, args.profile_mode, args.profile_interval / 1000)
+
+
+def write_report(tracker, destination, title):
+    """Print the report of a StageTimer or MemoryTracker, or write its summary as JSON when destination is a file."""
+    if destination == '-':
+        print(f"\n{title}:")
+        print(tracker.report())
+    else:
+        with open(destination, 'w', encoding='utf-8') as f:
+            json.dump(tracker.summary(), f, indent=2)
+        print(f"{title} written to: {destination}")
+
+
+def warn_untraced_backend(backend):
+    """Warn that a memory report cannot trace the trees of the lxml backend."""
+    if backend.name == 'lxml':
+        print("Warning: tracemalloc does not see the trees lxml builds, so the stage figures leave them out; "
+              "the peak RSS includes them. Use --xml-backend stdlib to trace them per stage.")
+
+
+def report_profile(profiler):
+    """Save a finished profile and print where it went and its top hotspots."""
+    profiler.save()
+    print(f"\nProfile written to: {profiler.path}")
+    for path in profiler.worker_paths:
+        print(f"Worker profile written to: {path}")
+    print(profiler.hotspots())
+
+
+def split_main(argv):
+    """Convert a single USX file."""
     import argparse
     
     parser = argparse.ArgumentParser(
@@ -30,38 +85,472 @@ Examples:
   
   # Convert with custom book title
   python -m dbl2writersrc.cli REV.usx toc.yml output/ --book-title "Book of Revelation"
+  
+  # Convert a large file one chapter at a time to bound memory use
+  python -m dbl2writersrc.cli BIBLE.usx toc.yml output/ --stream
+  
+  # Copy chunks straight out of the memory-mapped source without re-indenting them
+  python -m dbl2writersrc.cli BIBLE.usx toc.yml output/ --engine mmap
+  
+  # Regenerate only chapters 3 and 5 to 9, parsing nothing else
+  python -m dbl2writersrc.cli REV.usx toc.yml output/ --chapters 3,5-9 --engine lazy
+  
+  # Split chapters in parallel on four processes
+  python -m dbl2writersrc.cli PSA.usx toc.yml output/ --jobs 4
+  
+  # Convert a book straight from a zipped DBL release
+  python -m dbl2writersrc.cli release.zip toc.yml output/ --member release/USX_1/REV.usx
+  
+  # Reuse parsed TOCs and chapter indexes from earlier runs
+  python -m dbl2writersrc.cli REV.usx toc.yml output/ --chapters 3 --cache-dir ~/.cache/dbl2writersrc
+  
+  # Write all chunk files into a single archive (.zip, .tar, .tar.gz or .tgz)
+  python -m dbl2writersrc.cli REV.usx toc.yml REV.zip
+  
+  # Profile the conversion for pstats or snakeviz, or sample it at a lower cost
+  python -m dbl2writersrc.cli BIBLE.usx toc.yml output/ --profile split.prof
+  python -m dbl2writersrc.cli BIBLE.usx toc.yml output/ --profile split.prof --profile-mode sample
+  
+  # Report how long each stage and chapter took, or save the report as JSON
+  python -m dbl2writersrc.cli REV.usx toc.yml output/ --profile-stages
+  python -m dbl2writersrc.cli REV.usx toc.yml output/ --profile-stages stages.json
+  
+  # Report the peak and retained memory of each stage and the top allocation sites;
+  # only the stdlib backend's trees are traced, lxml's show in the peak RSS alone
+  python -m dbl2writersrc.cli BIBLE.usx toc.yml output/ --memory-report --xml-backend stdlib
+  
+  # Convert every book of a DBL release (see: batch --help)
+  python -m dbl2writersrc.cli batch release/ tocs/ output/ --jobs 8
+  
+  # Print a single chunk without converting the whole book (see: extract --help)
+  python -m dbl2writersrc.cli extract REV.usx toc.yml "REV 3:07"
+  
+  # Serve single chunks of a release over HTTP (see: serve --help)
+  python -m dbl2writersrc.cli serve release/ tocs/
         """
     )
     
-    parser.add_argument('usx_file', help='Path to the input USX file')
+    parser.add_argument('usx_file', help='Path to the input USX file, or to a zip archive when --member is given')
     parser.add_argument('toc_file', help='Path to the TOC YAML file')
-    parser.add_argument('output_dir', help='Path to the output directory')
-    parser.add_argument('--book-code', default='REV', help='Book code for the USX file (default: REV)')
-    parser.add_argument('--book-title', 
-                       default='- Biblica® Open Vietnamese Contemporary Bible 2015 (Biblica® Thiên Ban Kinh Thánh Hiện Đại)', 
-                       help='Book title for the USX file')
+    parser.add_argument('output_dir', help='Path to the output directory, or to a .zip, .tar, .tar.gz or .tgz archive')
+    parser.add_argument('--member', help='Name of the USX file inside the zip archive given as usx_file')
+    parser.add_argument('--book-code', default=DEFAULT_BOOK_CODE, help='Book code for the USX file (default: REV)')
+    parser.add_argument('--book-title', default=DEFAULT_BOOK_TITLE, help='Book title for the USX file')
     parser.add_argument('--verbose', '-v', action='store_true', help='Enable verbose output')
+    parser.add_argument('--engine', choices=sorted(ENGINES), default='dom',
+                       help='How to split the book: dom parses it whole, stream parses it one chapter '
+                            'at a time, lazy parses only the chapters being converted, mmap copies chunks '
+                            'from the mapped source as is, so its files are equivalent XML but not '
+                            'byte-identical to those of the other engines (default: dom)')
+    parser.add_argument('--stream', dest='engine', action='store_const', const='stream',
+                       help='Same as --engine stream')
+    parser.add_argument('--xml-backend', choices=['auto', 'lxml', 'stdlib'], default='auto',
+                       help='XML library to use; auto prefers lxml when installed (default: auto)')
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                       help='Number of worker processes for splitting chapters; not supported by '
+                            '--engine mmap (default: 1)')
+    parser.add_argument('--force', action='store_true',
+                       help='Rewrite every chunk file, even those unchanged since the last run')
+    parser.add_argument('--cache-dir',
+                       help='Directory for caching parsed TOCs between runs, and the chapter indexes of USX files '
+                            'for runs with --chapters')
+    parser.add_argument('--cache-size', type=int, default=256,
+                       help='Size cap of the parse cache in MB, least recently used entries are evicted (default: 256)')
+    parser.add_argument('--chapters',
+                       help="Only convert these chapters, such as 3,5-9; 'front' selects the front matter (default: all)")
+    parser.add_argument('--chunks',
+                       help="Only convert the chunks starting at these verses, such as 1,7-12; "
+                            "'title' selects title files (default: all)")
+    parser.add_argument('--profile-stages', nargs='?', const='-', metavar='FILE',
+                       help='Time every stage of the conversion and print the totals, call counts and '
+                            'p50/p95 per stage and per chapter, or write them to FILE as JSON')
+    parser.add_argument('--memory-report', nargs='?', const='-', metavar='FILE',
+                       help='Trace memory with tracemalloc and print the peak RSS, the peak and retained memory per '
+                            'stage and per chapter with the top allocation sites, or write them to FILE as JSON')
+    add_profile_arguments(parser)
+    
+    args = parser.parse_args(argv)
     
-    args = parser.parse_args()
+    try:
+        chapters = Selection(args.chapters, names=('front',)) if args.chapters else None
+        chunks = Selection(args.chunks, names=('title',)) if args.chunks else None
+        profiler = make_profiler(args)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+        
+    if args.engine == 'mmap' and args.jobs > 1:
+        print("Error: --engine mmap splits in a single process and cannot be combined with --jobs")
+        sys.exit(1)
     
     # Validate input files exist
     if not os.path.exists(args.usx_file):
         print(f"Error: USX file '{args.usx_file}' not found")
         sys.exit(1)
         
+    if args.member is not None and not zipfile.is_zipfile(args.usx_file):
+        print(f"Error: '{args.usx_file}' is not a zip archive")
+        sys.exit(1)
+        
     if not os.path.exists(args.toc_file):
         print(f"Error: TOC file '{args.toc_file}' not found")
         sys.exit(1)
     
     # Create splitter and run
     try:
-        splitter = USXSplitter(args.usx_file, args.toc_file, args.output_dir)
-        splitter.run()
+        splitter_class = ENGINES[args.engine]
+        splitter = splitter_class(args.usx_file, args.toc_file, args.output_dir,
+                                  backend=get_backend(args.xml_backend), jobs=args.jobs,
+                                  book_code=args.book_code, book_title=args.book_title,
+                                  usx_member=args.member, incremental=not args.force,
+                                  cache=make_cache(args.cache_dir, args.cache_size * 1024 * 1024),
+                                  chapters=chapters, chunks=chunks)
+        stage_timer = None
+        if args.profile_stages:
+            stage_timer = StageTimer()
+            stage_timer.instrument(splitter)
+        memory_tracker = None
+        if args.memory_report:
+            memory_tracker = MemoryTracker()
+            memory_tracker.instrument(splitter)
+            warn_untraced_backend(splitter.backend)
+        splitter.profiler = profiler
+        with profiler or contextlib.nullcontext(), memory_tracker or contextlib.nullcontext():
+            splitter.run()
         print(f"\nConversion completed successfully!")
         print(f"Output files created in: {args.output_dir}")
     except Exception as e:
         print(f"Error during conversion: {e}")
         sys.exit(1)
+        
+    if stage_timer is not None:
+        write_report(stage_timer, args.profile_stages, "Stage timings")
+        
+    if memory_tracker is not None:
+        write_report(memory_tracker, args.memory_report, "Memory report")
+        
+    if profiler is not None:
+        report_profile(profiler)
+
+
+def batch_main(argv):
+    """Convert every book of a DBL release."""
+    import argparse
+    
+    parser = argparse.ArgumentParser(
+        prog='dbl2writersrc.cli batch',
+        description='Convert all USX books of a DBL release, writing one output directory per book',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Books are read from release/USX_1/*.usx; the release can also be a zip
+archive, which is read without extracting it, or a single USX file holding
+several books, each of which is then parsed in its own process. The TOC of each
+book is looked up as tocs/<CODE>.yml or tocs/<CODE>/toc.yml, and its output
+goes to output/<CODE>/.
+
+Examples:
+  # Convert a whole release on eight processes
+  python -m dbl2writersrc.cli batch release/ tocs/ output/ --jobs 8
+  
+  # Convert a zipped release into one zip archive per book
+  python -m dbl2writersrc.cli batch release.zip tocs/ output/ --archive zip
+  
+  # Convert every book of a multi-book USX file
+  python -m dbl2writersrc.cli batch BIBLE.usx tocs/ output/
+  
+  # Profile every worker and print the hotspots of all of them together
+  python -m dbl2writersrc.cli batch release/ tocs/ output/ --profile batch.prof
+  
+  # Report how long each stage and each book's chapters took
+  python -m dbl2writersrc.cli batch release/ tocs/ output/ --profile-stages
+  
+  # Report the peak memory of every book and of its stages
+  python -m dbl2writersrc.cli batch BIBLE.usx tocs/ output/ --memory-report
+        """
+    )
+    
+    parser.add_argument('release_dir', help='Path to the DBL release directory or zip archive, or to a multi-book USX file')
+    parser.add_argument('toc_dir', help='Path to the directory of per-book TOC files')
+    parser.add_argument('output_dir', help='Path to the output directory')
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1,
+                       help='Number of books converted in parallel (default: number of CPUs)')
+    parser.add_argument('--engine', choices=sorted(ENGINES), default='dom',
+                       help='How to split the book: dom parses it whole, stream parses it one chapter '
+                            'at a time, lazy parses only the chapters being converted, mmap copies chunks '
+                            'from the mapped source as is, so its files are equivalent XML but not '
+                            'byte-identical to those of the other engines (default: dom)')
+    parser.add_argument('--stream', dest='engine', action='store_const', const='stream',
+                       help='Same as --engine stream')
+    parser.add_argument('--xml-backend', choices=['auto', 'lxml', 'stdlib'], default='auto',
+                       help='XML library to use; auto prefers lxml when installed (default: auto)')
+    parser.add_argument('--archive', choices=['zip', 'tar', 'tar.gz'],
+                       help='Write each book into output_dir/<CODE>.<archive> instead of a directory tree')
+    parser.add_argument('--force', action='store_true',
+                       help='Rewrite every chunk file, even those unchanged since the last run')
+    parser.add_argument('--cache-dir',
+                       help='Directory for caching parsed TOCs between runs')
+    parser.add_argument('--cache-size', type=int, default=256,
+                       help='Size cap of the parse cache in MB, least recently used entries are evicted (default: 256)')
+    parser.add_argument('--profile-stages', nargs='?', const='-', metavar='FILE',
+                       help='Time every stage of every book in its worker and print the totals, call counts and '
+                            'p50/p95 per stage and per book chapter, or write them to FILE as JSON')
+    parser.add_argument('--memory-report', nargs='?', const='-', metavar='FILE',
+                       help='Trace the memory of every book in its worker and print the peak and peak RSS of each '
+                            'book, the peak and retained memory per stage and the top allocation sites, or write them '
+                            'to FILE as JSON')
+    add_profile_arguments(parser)
+    
+    args = parser.parse_args(argv)
+    
+    if not os.path.exists(args.release_dir):
+        print(f"Error: Release '{args.release_dir}' not found")
+        sys.exit(1)
+        
+    if not os.path.isdir(args.toc_dir):
+        print(f"Error: TOC directory '{args.toc_dir}' not found")
+        sys.exit(1)
+    
+    try:
+        backend = get_backend(args.xml_backend)
+        profiler = make_profiler(args)
+        stage_timer = StageTimer() if args.profile_stages else None
+        memory_tracker = MemoryTracker() if args.memory_report else None
+        if memory_tracker is not None:
+            warn_untraced_backend(backend)
+        multibook = os.path.isfile(args.release_dir) and not zipfile.is_zipfile(args.release_dir)
+        if multibook:
+            books = find_multibook_books(args.release_dir, args.toc_dir)
+        else:
+            books = find_release_books(args.release_dir, args.toc_dir)
+        if not books:
+            print(f"Error: No USX books with a TOC found in '{args.release_dir}'")
+            sys.exit(1)
+        print(f"Converting {len(books)} books with {args.jobs} workers...")
+        split = split_multibook if multibook else split_books
+        with profiler or contextlib.nullcontext():
+            failed = split(books, args.output_dir, jobs=args.jobs,
+                           backend=args.xml_backend, engine=args.engine, archive=args.archive,
+                           incremental=not args.force, cache_dir=args.cache_dir,
+                           cache_size=args.cache_size * 1024 * 1024, profiler=profiler,
+                           stage_timer=stage_timer, memory_tracker=memory_tracker)
+    except Exception as e:
+        print(f"Error during conversion: {e}")
+        sys.exit(1)
+        
+    if stage_timer is not None:
+        write_report(stage_timer, args.profile_stages, "Stage timings")
+        
+    if memory_tracker is not None:
+        write_report(memory_tracker, args.memory_report, "Memory report")
+        
+    if profiler is not None:
+        report_profile(profiler)
+        
+    if failed:
+        print(f"\nConversion failed for: {', '.join(sorted(failed))}")
+        sys.exit(1)
+    print(f"\nConversion of {len(books)} books completed successfully!")
+    print(f"Output files created in: {args.output_dir}")
+
+
+def toc_main(argv):
+    """Work with TOC files."""
+    import argparse
+    
+    parser = argparse.ArgumentParser(
+        prog='dbl2writersrc.cli toc',
+        description='Work with TOC files',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Compile a TOC into toc.tocc, which is then used instead of toc.yml
+  python -m dbl2writersrc.cli toc compile toc.yml
+  
+  # Compile every TOC below a directory
+  python -m dbl2writersrc.cli toc compile tocs/
+        """
+    )
+    subparsers = parser.add_subparsers(dest='action', required=True)
+    compile_parser = subparsers.add_parser(
+        'compile', help='Validate YAML TOCs and write their compiled form next to them')
+    compile_parser.add_argument('toc_files', nargs='+',
+                                help='TOC YAML files, or directories to search for *.yml files')
+    
+    args = parser.parse_args(argv)
+    
+    toc_files = []
+    for path in args.toc_files:
+        if os.path.isdir(path):
+            toc_files.extend(sorted(Path(path).rglob('*.yml')))
+        elif os.path.exists(path):
+            toc_files.append(Path(path))
+        else:
+            print(f"Error: TOC file '{path}' not found")
+            sys.exit(1)
+    
+    failed = False
+    for toc_file in toc_files:
+        try:
+            compiled_path = compile_toc(toc_file)
+            print(f"Compiled: {toc_file} -> {compiled_path}")
+        except Exception as e:
+            print(f"Error compiling {toc_file}: {e}")
+            failed = True
+            
+    if failed:
+        sys.exit(1)
+
+
+def extract_main(argv):
+    """Extract a single chunk of a USX file."""
+    import argparse
+    import re
+    
+    parser = argparse.ArgumentParser(
+        prog='dbl2writersrc.cli extract',
+        description='Extract one chunk of a USX file, parsing only the chapter that holds it',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+The chunk is given as CHAPTER:CHUNK, where the chapter can be 'front' and the
+chunk 'title', optionally preceded by the book code, which must match the
+code of the USX book element. The chunk is written exactly as a full
+conversion with the same options would write it.
+
+Examples:
+  # Print chunk 07 of Revelation 3
+  python -m dbl2writersrc.cli extract REV.usx toc.yml "REV 3:07"
+  
+  # Regenerate one chunk file in an output directory
+  python -m dbl2writersrc.cli extract REV.usx toc.yml 3:07 -o output/03/07.usx
+  
+  # Look the chapter up in the parse cache of earlier runs
+  python -m dbl2writersrc.cli extract REV.usx toc.yml 3:title --cache-dir ~/.cache/dbl2writersrc
+        """
+    )
+    
+    parser.add_argument('usx_file', help='Path to the input USX file, or to a zip archive when --member is given')
+    parser.add_argument('toc_file', help='Path to the TOC YAML file')
+    parser.add_argument('chunk', help='Chunk to extract, such as 3:07, 3:title, front or "REV 3:07"')
+    parser.add_argument('--output', '-o', help='File to write the chunk to (default: standard output)')
+    parser.add_argument('--member', help='Name of the USX file inside the zip archive given as usx_file')
+    parser.add_argument('--book-code', help='Book code for the USX file (default: REV)')
+    parser.add_argument('--book-title', default=DEFAULT_BOOK_TITLE, help='Book title for the USX file')
+    parser.add_argument('--cache-dir',
+                       help='Directory for caching parsed TOCs and the chapter indexes of USX files between runs')
+    parser.add_argument('--cache-size', type=int, default=256,
+                       help='Size cap of the parse cache in MB, least recently used entries are evicted (default: 256)')
+    
+    args = parser.parse_args(argv)
+    
+    match = re.fullmatch(r'\s*(?:(\w+)\s+)?(front|\d+)(?::(title|\d+))?\s*', args.chunk)
+    if match is None or (match.group(3) is None and match.group(2) != 'front'):
+        print(f"Error: Invalid chunk '{args.chunk}', expected CHAPTER:CHUNK such as 3:07")
+        sys.exit(1)
+    expected_book, chapter, chunk = match.groups()
+    chapter = chapter if chapter == 'front' else int(chapter)
+    chunk = int(chunk) if chunk not in (None, 'title') else 'title'
+        
+    if not os.path.exists(args.usx_file):
+        print(f"Error: USX file '{args.usx_file}' not found")
+        sys.exit(1)
+        
+    if args.member is not None and not zipfile.is_zipfile(args.usx_file):
+        print(f"Error: '{args.usx_file}' is not a zip archive")
+        sys.exit(1)
+        
+    if not os.path.exists(args.toc_file):
+        print(f"Error: TOC file '{args.toc_file}' not found")
+        sys.exit(1)
+    
+    try:
+        found = extract_chunk(args.usx_file, args.toc_file, chapter, chunk,
+                              book_code=args.book_code or DEFAULT_BOOK_CODE, book_title=args.book_title,
+                              usx_member=args.member, expected_book=expected_book,
+                              cache=make_cache(args.cache_dir, args.cache_size * 1024 * 1024))
+    except Exception as e:
+        print(f"Error during extraction: {e}")
+        sys.exit(1)
+        
+    if found is None:
+        print(f"Error: Chunk '{args.chunk}' not found in the TOC or USX file")
+        sys.exit(1)
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_bytes(found.data)
+    else:
+        sys.stdout.buffer.write(found.data)
+
+
+def serve_main(argv):
+    """Serve single chunks of a DBL release over HTTP."""
+    import argparse
+    
+    parser = argparse.ArgumentParser(
+        prog='dbl2writersrc.cli serve',
+        description='Serve single chunks of the books of a DBL release over HTTP, keeping parsed books in memory',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Books and TOCs are found as for batch. A chunk is requested as
+/<CODE>/<chapter>/<chunk>, where the chapter can be 'front' and the chunk
+'title'. Books are reloaded when their USX or TOC content changes.
+
+Examples:
+  # Serve a release on port 8000
+  python -m dbl2writersrc.cli serve release/ tocs/
+  
+  # Fetch chunk 07 of Revelation 3
+  curl http://127.0.0.1:8000/REV/03/07
+        """
+    )
+    
+    parser.add_argument('release_dir', help='Path to the DBL release directory or zip archive')
+    parser.add_argument('toc_dir', help='Path to the directory of per-book TOC files')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8000, help='Port to listen on (default: 8000)')
+    parser.add_argument('--engine', choices=['dom', 'mmap'], default='dom',
+                       help='How to split the books: dom parses them, mmap copies chunks from the source '
+                            'as is, as equivalent XML but not byte-identical to dom (default: dom)')
+    parser.add_argument('--cache-size', type=int, default=512,
+                       help='Memory budget for loaded books in MB, least recently used books are dropped (default: 512)')
+    
+    args = parser.parse_args(argv)
+    
+    if not os.path.exists(args.release_dir):
+        print(f"Error: Release '{args.release_dir}' not found")
+        sys.exit(1)
+        
+    if not os.path.isdir(args.toc_dir):
+        print(f"Error: TOC directory '{args.toc_dir}' not found")
+        sys.exit(1)
+    
+    books = find_release_books(args.release_dir, args.toc_dir)
+    if not books:
+        print(f"Error: No USX books with a TOC found in '{args.release_dir}'")
+        sys.exit(1)
+    try:
+        serve(books, host=args.host, port=args.port, engine=args.engine,
+              max_bytes=args.cache_size * 1024 * 1024)
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        print(f"Error: Could not serve on {args.host}:{args.port}: {e}")
+        sys.exit(1)
+
+
+COMMANDS = {
+    'batch': batch_main,
+    'extract': extract_main,
+    'serve': serve_main,
+    'toc': toc_main,
+}
+
+
+def main():
+    """Main CLI function."""
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        COMMANDS[sys.argv[1]](sys.argv[2:])
+    else:
+        split_main(sys.argv[1:])
 
 
 if __name__ == "__main__":
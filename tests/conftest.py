@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Add the directory above the package to the path so we can import it
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
@@ -0,0 +1,103 @@
+"""
+The stdlib and lxml backends must split a book into the same bytes.
+"""
+
+import io
+
+import pytest
+import yaml
+
+pytest.importorskip('lxml')
+
+from dbl2writersrc.usx_splitter import ENGINES, Book, BookCache, USXSplitter, get_backend, normalize_toc, split
+
+# Paragraphs that cross chunk boundaries, text before a paragraph's first
+# verse, a footnote, a comment, text before a chapter's first verse and a
+# chapter without chunks in the TOC
+USX = b'''<?xml version="1.0" encoding="utf-8"?>
+<usx version="3.0">
+  <book code="TST" style="id">- Backend test book</book>
+  <para style="h">Test</para>
+  <para style="mt1">THE TEST BOOK</para>
+  <chapter number="1" style="c" sid="TST 1" />
+  <para style="s1">Beginnings</para>
+  <para style="p"><verse number="1" style="v" sid="TST 1:1" />In the beginning.<verse eid="TST 1:1" />
+<verse number="2" style="v" sid="TST 1:2" />Then <char style="w">more</char>.<note caller="+" style="f"><char style="fr">1:2 </char><char style="ft">A note &amp; more.</char></note><verse eid="TST 1:2" /></para>
+  <!-- <chapter number="9" style="c" sid="TST 9" /> -->
+  <para style="q1">and this continues verse two<verse number="3" style="v" sid="TST 1:3" />Three.<verse eid="TST 1:3" />
+<verse number="4" style="v" sid="TST 1:4" />Four.<verse eid="TST 1:4" /></para>
+  <para style="p"><verse number="5-6" style="v" sid="TST 1:5-6" />Five and six.<verse eid="TST 1:5-6" /></para>
+  <chapter eid="TST 1" />
+  <chapter number="2" style="c" sid="TST 2" />
+  <para style="ip">Before any verse.</para>
+  <para style="q1">Lead-in <verse number="1" style="v" sid="TST 2:1" />Again.<verse eid="TST 2:1" />
+<verse number="2" style="v" sid="TST 2:2" />The end.<verse eid="TST 2:2" /></para>
+  <chapter eid="TST 2" />
+  <chapter number="3" style="c" sid="TST 3" />
+  <para style="p"><verse number="1" style="v" sid="TST 3:1" />Unlisted.<verse eid="TST 3:1" /></para>
+  <chapter eid="TST 3" />
+</usx>
+'''
+
+TOC = [
+    {'chapter': 'front', 'chunks': ['title']},
+    {'chapter': '01', 'chunks': ['title', '01', '03', '05']},
+    {'chapter': '02', 'chunks': ['title', '01', '02']},
+]
+
+
+def split_with(backend, engine):
+    return {chunk.path: chunk.data for chunk in split(USX, TOC, engine=engine, backend=get_backend(backend))}
+
+
+@pytest.mark.parametrize('engine', list(ENGINES))
+def test_backends_split_identically(engine):
+    stdlib = split_with('stdlib', engine)
+    assert stdlib == split_with('lxml', engine)
+    assert sorted(stdlib) == ['01/01.usx', '01/03.usx', '01/05.usx', '01/title.usx',
+                              '02/01.usx', '02/02.usx', '02/title.usx', 'front/title.usx']
+
+
+@pytest.mark.parametrize('backend', ['stdlib', 'lxml'])
+def test_extracting_a_chunk_twice(backend):
+    splitter = USXSplitter(io.BytesIO(USX), None, None, backend=get_backend(backend))
+    splitter.toc_data = normalize_toc(TOC)
+    splitter.load_usx()
+
+    first = splitter.find_chunk(1, 3)
+    assert b'and this continues verse two' not in first.data
+    assert b'Three.' in first.data and b'Four.' in first.data
+    assert splitter.find_chunk(1, 3) == first
+    assert splitter.find_chunk(1, 1).data.count(b'<para style="q1">') == 1
+
+
+@pytest.mark.parametrize('engine', list(ENGINES))
+def test_text_before_the_first_verse_is_kept(engine):
+    chunks = split_with('lxml', engine)
+    assert b'<para style="ip">Before any verse.</para>' in chunks['02/01.usx']
+    assert b'<para style="q1">Lead-in <verse number="1"' in chunks['02/01.usx']
+    assert b'Lead-in' not in chunks['02/02.usx']
+
+
+def test_book_chunk_twice(tmp_path):
+    usx_path = tmp_path / 'TST.usx'
+    usx_path.write_bytes(USX)
+    expected = split_with('stdlib', 'dom')['01/03.usx']
+
+    with Book(usx_path, TOC) as book:
+        assert book.chunk(1, 3).data == expected
+        assert book.chunk(1, 3).data == expected
+
+
+@pytest.mark.parametrize('engine', ['dom', 'lazy'])
+def test_cached_book_chunk_twice(tmp_path, engine):
+    usx_path = tmp_path / 'TST.usx'
+    usx_path.write_bytes(USX)
+    toc_path = tmp_path / 'TST.yml'
+    toc_path.write_text(yaml.safe_dump(TOC))
+    expected = split_with('stdlib', engine)['01/03.usx']
+
+    cache = BookCache({'TST': (usx_path, None, toc_path)}, engine=engine)
+    assert cache.get('TST').backend.name == 'lxml'
+    assert cache.get('TST').find_chunk(1, 3).data == expected
+    assert cache.get('TST').find_chunk(1, 3).data == expected
@@ -0,0 +1,35 @@
+"""
+The work of every engine must grow linearly with the book.
+"""
+
+import pytest
+
+from dbl2writersrc.usx_splitter import ENGINES, USXSplitter, WorkCounters
+from dbl2writersrc.benchmarks.complexity import AXES, check_growth, count_work, format_growth
+
+
+@pytest.mark.parametrize('engine', list(ENGINES))
+def test_work_is_counted(engine):
+    counts = count_work(AXES['chapters'][0], engine)
+    assert all(counts[name] > 0 for name in WorkCounters.NAMES)
+
+
+@pytest.mark.parametrize('axis', list(AXES))
+@pytest.mark.parametrize('engine', list(ENGINES))
+def test_work_grows_linearly(engine, axis):
+    results = check_growth([engine], [axis])
+    assert len(results) == len(AXES[axis])
+    assert all(result['linear'] for result in results), format_growth(results)
+
+
+def test_rescan_per_chapter_is_caught(monkeypatch):
+    chapter_elements = USXSplitter.chapter_elements
+
+    def rescanning_chapter_elements(self, chapter_num):
+        for _ in self.usx_content:
+            pass
+        return chapter_elements(self, chapter_num)
+
+    monkeypatch.setattr(USXSplitter, 'chapter_elements', rescanning_chapter_elements)
+    results = check_growth(['dom'], ['chapters'])
+    assert not all(result['linear'] for result in results), format_growth(results)
@@ -0,0 +1,51 @@
+"""
+The byte scans of the lazy engine and of multi-book files must see the same
+chapters and books a parser does.
+"""
+
+import pytest
+
+from dbl2writersrc.usx_splitter import scan_book_offsets, scan_chapter_offsets
+
+BOOK = b'''<?xml version="1.0" encoding="utf-8"?>
+<usx version="3.0">
+  <book code="TST" style="id">- Scan test book</book>
+  <!-- <chapter number="7" style="c" sid="TST 7" /> -->
+  <chapter number="1" style="c" sid="TST 1" />
+  <para style="p"><verse number="1" style="v" sid="TST 1:1" /><![CDATA[<chapter eid="TST 1" />]]><verse eid="TST 1:1" /></para>
+  <chapter eid="TST 1" />
+  <chapter number="2" style="c" sid="TST 2" />
+  <para style="p"><verse number="1" style="v" sid="TST 2:1" />Two.<verse eid="TST 2:1" /></para>
+</usx>
+'''
+
+
+def test_chapter_offsets_skip_comments_and_cdata():
+    front, chapters = scan_chapter_offsets(BOOK)
+    assert sorted(chapters) == [1, 2]
+
+    assert BOOK[slice(*front)].strip().startswith(b'<book')
+    assert BOOK[slice(*front)].strip().endswith(b'-->')
+    (start, end), = chapters[1]
+    assert BOOK[start:end].startswith(b'<chapter number="1"')
+    assert BOOK[start:end].endswith(b'<chapter eid="TST 1" />')
+    (start, end), = chapters[2]
+    assert BOOK[start:end].startswith(b'<chapter number="2"')
+    assert BOOK[start:end].rstrip().endswith(b'</para>')
+
+
+def test_chapter_without_number():
+    with pytest.raises(ValueError, match='without a number'):
+        scan_chapter_offsets(b'<usx><chapter style="c" sid="TST 1" /></usx>')
+
+
+def test_book_offsets_skip_comments():
+    data = (b'<?xml version="1.0" encoding="utf-8"?>\n<usx version="3.0"><book code="GEN" style="id" />'
+            b'<para style="p">One</para></usx>\n'
+            b'<?xml version="1.0" encoding="utf-8"?>\n<usx version="3.0"><!-- <book code="XXX" /> -->'
+            b'<book code="EXO" style="id" /><para style="p"><![CDATA[<book code="YYY" />]]></para></usx>\n')
+    root_start, root_end, books = scan_book_offsets(data)
+    assert (root_start, root_end) == (b'<usx version="3.0">', b'</usx>')
+    assert [code for code, _, _ in books] == ['GEN', 'EXO']
+    assert data[books[0][1]:books[0][2]] == b'<book code="GEN" style="id" /><para style="p">One</para>'
+    assert data[books[1][1]:books[1][2]].endswith(b']]></para>')
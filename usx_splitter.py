@@ -7,271 +7,2977 @@ It reads the TOC YAML file to understand the chapter and chunk organization,
 then splits the content accordingly.
 """
 
+import bisect
+import contextlib
+import cProfile
+import functools
+import gzip
+import hashlib
+import inspect
+import io
+import json
+import marshal
+import mmap
 import os
+import pstats
+import signal
+import sys
+import tarfile
+import time
+import tracemalloc
 import yaml
 import xml.etree.ElementTree as ET
-from pathlib import Path
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path, PurePosixPath
 import re
+import zipfile
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# libyaml's C loader when PyYAML was built with it
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+# Suffix of compiled TOC files, written next to the YAML they were compiled from
+COMPILED_TOC_SUFFIX = '.tocc'
+COMPILED_TOC_VERSION = 1
+
+
+# Paragraph styles that belong to a chapter's title file rather than its chunks
+TITLE_STYLES = ['s1', 's2', 's3', 'mt1', 'mt2', 'mt3']
+
+# Styles of the book and paragraph elements that make up the front title file
+FRONT_STYLES = ['h', 'toc1', 'toc2', 'toc3', 'mt1', 'mt2', 'mt3']
+
+# Start, end and empty-element tags; comments, CDATA sections, processing
+# instructions and declarations match without a tag name
+XML_TAG_PATTERN = re.compile(
+    rb'<(?:!--.*?-->|!\[CDATA\[.*?\]\]>|[?!][^>]*>'
+    rb'|(/?)([^\s/>]+)((?:[^>"\']|"[^"]*"|\'[^\']*\')*?)\s*(/?)>)', re.S)
+XML_ATTRIBUTE_PATTERN = re.compile(rb'([^\s=]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+# Chapter milestones, with the comments and CDATA sections that may hide
+# markup matched too, without a group, so they are skipped over
+CHAPTER_SCAN_PATTERN = re.compile(
+    rb'<(?:!--.*?-->|!\[CDATA\[.*?\]\]>|chapter\b((?:[^>"\']|"[^"]*"|\'[^\']*\')*)>)', re.S)
+# Book elements and, given the root's name, root end tags, likewise. The
+# shared '<' is kept outside the alternatives, which keeps the search fast.
+BOOK_SCAN_PATTERN = (
+    rb'<(?:!--.*?-->|!\[CDATA\[.*?\]\]>|book\b((?:[^>"\']|"[^"]*"|\'[^\']*\')*)>|(/%s\s*>))')
+XML_ENCODING_PATTERN = re.compile(rb'\s*<\?xml[^>]*?encoding\s*=\s*["\']([^"\']+)')
+
+
+class ElementTreeBackend:
+    """XML parsing with the standard library's ElementTree."""
+    
+    name = 'stdlib'
+    
+    def parse(self, source):
+        """Parse a USX document and return its root element."""
+        return ET.parse(source).getroot()
+    
+    def iterparse(self, source, events):
+        """Parse a USX document incrementally."""
+        return ET.iterparse(source, events=events)
+    
+    def fromstring(self, data):
+        """Parse a USX fragment from bytes and return its root element."""
+        return ET.fromstring(data)
+    
+    def tostring(self, element):
+        """Serialize an element and its tail to compact UTF-8 bytes."""
+        return ET.tostring(element, encoding='utf-8')
+    
+    def Element(self, tag, attrib={}, **extra):
+        return ET.Element(tag, attrib, **extra)
+
+
+
+class LxmlBackend(ElementTreeBackend):
+    """XML parsing with lxml's C parser.
+    
+    Elements from either backend are serialized by USXWriter, so the output
+    is byte-identical whichever backend parsed the book.
+    """
+    
+    name = 'lxml'
+    
+    def __init__(self):
+        self.parser = lxml_etree.XMLParser(remove_comments=True, remove_pis=True)
+    
+    def parse(self, source):
+        """Parse a USX document and return its root element."""
+        return lxml_etree.parse(source, self.parser).getroot()
+    
+    def iterparse(self, source, events):
+        """Parse a USX document incrementally."""
+        return lxml_etree.iterparse(source, events=events, remove_comments=True, remove_pis=True)
+    
+    def fromstring(self, data):
+        """Parse a USX fragment from bytes and return its root element."""
+        return lxml_etree.fromstring(data, self.parser)
+    
+    def tostring(self, element):
+        """Serialize an element and its tail to compact UTF-8 bytes."""
+        return lxml_etree.tostring(element, encoding='utf-8')
+    
+    def Element(self, tag, attrib={}, **extra):
+        return lxml_etree.Element(tag, attrib, **extra)
+
+
+
+def _toc_number(value, what):
+    """Convert a chapter or chunk number from a TOC, such as '01', to an int."""
+    if isinstance(value, int) and not isinstance(value, bool):
+        number = value
+    elif isinstance(value, str) and value.isdigit():
+        number = int(value)
+    else:
+        raise ValueError(f"Invalid {what} number in TOC: {value!r}")
+    if number < 0:
+        raise ValueError(f"Invalid {what} number in TOC: {value!r}")
+    return number
+
+
+def normalize_toc(toc_data):
+    """Validate a parsed TOC and convert its chapter and chunk numbers to ints.
+    
+    Returns a list of {'chapter': ..., 'chunks': [...]} entries where the
+    chapter is 'front' or an int, and the chunks are 'title' followed by the
+    sorted, unique chunk start verses. Raises ValueError for malformed TOCs.
+    """
+    if not isinstance(toc_data, list):
+        raise ValueError("TOC must be a list of chapter entries")
+        
+    normalized = []
+    seen = set()
+    for entry in toc_data:
+        if not isinstance(entry, dict) or 'chapter' not in entry:
+            raise ValueError(f"Invalid TOC entry: {entry!r}")
+        chapter = entry['chapter']
+        if chapter != 'front':
+            chapter = _toc_number(chapter, 'chapter')
+        if chapter in seen:
+            raise ValueError(f"Duplicate chapter in TOC: {entry['chapter']!r}")
+        seen.add(chapter)
+        
+        chunks = entry.get('chunks') or []
+        if not isinstance(chunks, list):
+            raise ValueError(f"Chunks of chapter {entry['chapter']!r} must be a list")
+        starts = sorted({_toc_number(chunk, 'chunk') for chunk in chunks if chunk != 'title'})
+        title = ['title'] if 'title' in chunks else []
+        normalized.append({'chapter': chapter, 'chunks': title + starts})
+        
+    return normalized
+
+
+def compiled_toc_path(toc_file_path):
+    """Return the path of the compiled form of a YAML TOC file."""
+    return Path(toc_file_path).with_suffix(COMPILED_TOC_SUFFIX)
+
+
+def compile_toc(toc_file_path):
+    """Compile a YAML TOC into its validated, normalized form and return the path written.
+    
+    The compiled file is JSON and records a hash of the YAML it came from, so
+    load_compiled_toc can tell when it is out of date.
+    """
+    data = Path(toc_file_path).read_bytes()
+    toc_data = normalize_toc(yaml.load(data, Loader=YAML_LOADER))
+    compiled = {
+        'version': COMPILED_TOC_VERSION,
+        'source_sha256': hashlib.sha256(data).hexdigest(),
+        'toc': toc_data,
+    }
+    compiled_path = compiled_toc_path(toc_file_path)
+    with open(compiled_path, 'w', encoding='utf-8') as f:
+        json.dump(compiled, f, separators=(',', ':'))
+    return compiled_path
+
+
+def load_compiled_toc(toc_file_path, data=None, log=print):
+    """Return the normalized TOC from a compiled TOC file, or None when there is no usable one.
+    
+    toc_file_path can be the compiled file itself, or a YAML TOC whose compiled
+    form sits next to it; data holds the YAML bytes when they are already read.
+    A compiled form that no longer matches its YAML is ignored, with a
+    warning passed to log.
+    """
+    toc_file_path = Path(toc_file_path)
+    is_compiled = toc_file_path.suffix == COMPILED_TOC_SUFFIX
+    compiled_path = toc_file_path if is_compiled else compiled_toc_path(toc_file_path)
+    try:
+        with open(compiled_path, 'r', encoding='utf-8') as f:
+            compiled = json.load(f)
+    except FileNotFoundError:
+        return None
+        
+    if compiled.get('version') != COMPILED_TOC_VERSION:
+        log(f"Warning: Ignoring compiled TOC {compiled_path} from another version")
+        return None
+    if not is_compiled:
+        if data is None:
+            data = toc_file_path.read_bytes()
+        if compiled.get('source_sha256') != hashlib.sha256(data).hexdigest():
+            log(f"Warning: Ignoring out-of-date compiled TOC {compiled_path}")
+            return None
+    return compiled['toc']
+
+
+def _escape_text(text):
+    """Escape text and tail content the way ElementTree does."""
+    if '&' in text:
+        text = text.replace('&', '&amp;')
+    if '<' in text:
+        text = text.replace('<', '&lt;')
+    if '>' in text:
+        text = text.replace('>', '&gt;')
+    return text
+
+
+def _escape_attrib(value):
+    """Escape an attribute value the way ElementTree does."""
+    if '&' in value:
+        value = value.replace('&', '&amp;')
+    if '<' in value:
+        value = value.replace('<', '&lt;')
+    if '>' in value:
+        value = value.replace('>', '&gt;')
+    if '"' in value:
+        value = value.replace('"', '&quot;')
+    if '\r' in value:
+        value = value.replace('\r', '&#13;')
+    if '\n' in value:
+        value = value.replace('\n', '&#10;')
+    if '\t' in value:
+        value = value.replace('\t', '&#09;')
+    return value
+
+
+class WorkCounters:
+    """Count the work a split does, to check that it grows linearly with the book.
+    
+    elements_visited counts the elements (or, for the mapped engine, the
+    tags) the indexing and extraction loops look at, paragraphs_copied the
+    paragraph pieces put into chunks and bytes_serialized the bytes of the
+    rendered documents. The counts cover the current process only.
+    """
+    
+    NAMES = ['elements_visited', 'paragraphs_copied', 'bytes_serialized']
+    
+    def __init__(self):
+        self.reset()
+    
+    def reset(self):
+        """Set every count back to zero."""
+        for name in self.NAMES:
+            setattr(self, name, 0)
+    
+    def snapshot(self):
+        """Return the current counts as a dict."""
+        return {name: getattr(self, name) for name in self.NAMES}
+
+
+# Work done by the splitters of this process
+WORK_COUNTERS = WorkCounters()
+
+
+def _peak_rss():
+    """Return the peak resident set size of this process in bytes, or None where it is not reported."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _chapter_order(chapter):
+    """Sort key of a chapter of the stage records: by book label if merged, then front matter first."""
+    label, _, name = str(chapter).rpartition(' ')
+    return label, -1 if name == 'front' else int(name)
+
+
+def _percentile(ordered, percent):
+    """Return the nearest-rank percentile of a sorted, non-empty list."""
+    rank = max(1, -(-len(ordered) * percent // 100))
+    return ordered[int(rank) - 1]
+
+
+class StageTimer:
+    """Time the stages of a split, overall and per chapter.
+    
+    instrument wraps the stage methods of a splitter, and the write method of
+    its sink as write_output, so that every call is timed and attributed to
+    the chapter being processed. Times are inclusive: process_chapter holds
+    the time of its create_chunk_file calls, which hold render_document and
+    write_output. Chapter workers of a parallel run time their own splitters
+    and send the timings back, so worker time overlaps in the totals.
+    """
+    
+    STAGES = [
+        'load_toc', 'load_usx', 'iter_chapters', 'build_chapter_index', 'process_front_matter',
+        'extract_front_content', 'process_chapters_parallel', 'parse_chapter', 'process_chapter',
+        'extract_chapter_content',
+        'chapter_elements', 'extract_chunks', 'extract_title_content', 'create_chunk_file', 'write_document',
+        'render_document', 'write_output',
+    ]
+    
+    # Splitter attribute that instrument points at the timer
+    SPLITTER_ATTRIBUTE = 'stage_timer'
+    
+    def __init__(self):
+        # (stage, chapter, seconds) of every timed call; chapter is None outside chapters
+        self.records = []
+        self.chapter = None
+        
+    def instrument(self, splitter):
+        """Time the stage methods of a splitter from now on."""
+        for stage in self.STAGES:
+            method = getattr(splitter, stage, None)
+            if method is not None:
+                setattr(splitter, stage, self._timed(stage, method))
+        if splitter.sink is not None:
+            splitter.sink.write = self._timed('write_output', splitter.sink.write)
+        setattr(splitter, self.SPLITTER_ATTRIBUTE, self)
+    
+    def _timed(self, stage, method):
+        """Return a wrapper of method that measures every call between _start and _finish."""
+        if inspect.isgeneratorfunction(method):
+            @functools.wraps(method)
+            def timed_generator(*args, **kwargs):
+                # Measure the work done for each item, not the time the caller holds it
+                items = method(*args, **kwargs)
+                while True:
+                    started = self._start(stage)
+                    try:
+                        item = next(items)
+                    except StopIteration:
+                        return
+                    finally:
+                        self._finish(stage, started)
+                    yield item
+            return timed_generator
+            
+        @functools.wraps(method)
+        def timed(*args, **kwargs):
+            previous = self.chapter
+            if stage in ('process_chapter', 'parse_chapter'):
+                self.chapter = args[0]['chapter']
+            elif stage == 'process_front_matter':
+                self.chapter = 'front'
+            started = self._start(stage)
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self._finish(stage, started)
+                self.chapter = previous
+        return timed
+    
+    def _start(self, stage):
+        """Begin measuring a call of a stage and return what _finish needs to complete it."""
+        return time.perf_counter()
+    
+    def _finish(self, stage, started):
+        """Record a call of a stage begun by _start."""
+        self.records.append((stage, self.chapter, time.perf_counter() - started))
+    
+    def merge(self, records, label=None):
+        """Add the records of a worker's timer, prefixing their chapters with label if given."""
+        for stage, chapter, seconds in records:
+            if label is not None and chapter is not None:
+                chapter = f"{label} {chapter}"
+            self.records.append((stage, chapter, seconds))
+    
+    @staticmethod
+    def _stats(durations):
+        """Return the call count, total, p50 and p95 of a list of durations in seconds."""
+        ordered = sorted(durations)
+        return {
+            'count': len(ordered),
+            'total': sum(ordered),
+            'p50': _percentile(ordered, 50),
+            'p95': _percentile(ordered, 95),
+        }
+    
+    def summary(self):
+        """Return the statistics of every stage, overall and per chapter, as a JSON-ready dict.
+        
+        Chapters are keyed by their number as a string, or 'front', after
+        the label of merged records such as 'REV 3'.
+        """
+        stages = {}
+        chapters = {}
+        for stage, chapter, seconds in self.records:
+            stages.setdefault(stage, []).append(seconds)
+            if chapter is not None:
+                chapters.setdefault(chapter, {}).setdefault(stage, []).append(seconds)
+                
+        order = sorted(chapters, key=_chapter_order)
+        return {
+            'stages': {stage: self._stats(stages[stage]) for stage in self.STAGES if stage in stages},
+            'chapters': {
+                str(chapter): {stage: self._stats(chapters[chapter][stage])
+                               for stage in self.STAGES if stage in chapters[chapter]}
+                for chapter in order
+            },
+        }
+    
+    def report(self):
+        """Return the statistics as text: one table of stages and one of chapters, slowest first."""
+        summary = self.summary()
+        rows = [['stage', 'calls', 'total ms', 'p50 ms', 'p95 ms']]
+        for stage, stats in summary['stages'].items():
+            rows.append([stage, str(stats['count'])] +
+                        [f"{stats[name] * 1000:.2f}" for name in ('total', 'p50', 'p95')])
+        lines = self._table(rows)
+        
+        rows = [['chapter', 'total ms', 'documents', 'p50 ms', 'p95 ms']]
+        chapters = []
+        for chapter, stages in summary['chapters'].items():
+            total = stages.get('process_chapter', stages.get('process_front_matter'))
+            documents = stages.get('write_document')
+            if total is None:
+                continue
+            chapters.append((total['total'], chapter, documents))
+        for total, chapter, documents in sorted(chapters, key=lambda item: -item[0]):
+            if documents is None:
+                rows.append([chapter, f"{total * 1000:.2f}", '0', '-', '-'])
+            else:
+                rows.append([chapter, f"{total * 1000:.2f}", str(documents['count']),
+                             f"{documents['p50'] * 1000:.2f}", f"{documents['p95'] * 1000:.2f}"])
+        if len(rows) > 1:
+            lines += [''] + self._table(rows)
+        return '\n'.join(lines)
+    
+    @staticmethod
+    def _table(rows):
+        """Format rows of cells as lines of a table with a left-aligned first column."""
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        return ['  '.join([row[0].ljust(widths[0])] + [cell.rjust(width) for cell, width in zip(row[1:], widths[1:])])
+                for row in rows]
+
+
+class MemoryTracker(StageTimer):
+    """Account for the memory of the stages of a split with tracemalloc.
+    
+    instrument wraps the same stages as StageTimer. Every call records its
+    peak, the most memory it had allocated above what was allocated when it
+    started, and what it retained when it returned. Used as a context
+    manager, the tracker traces the run as a stage of its own. The run and
+    the stages of SNAPSHOT_STAGES take tracemalloc snapshots at their
+    boundaries, which show the allocation sites that retained the most.
+    Workers track their own splitters and their exports are merged here.
+    
+    tracemalloc only sees memory allocated through Python, not the trees
+    libxml2 builds for the lxml backend, so the tracker also records the
+    peak resident set size of every process when its outermost stage ends.
+    """
+    
+    SNAPSHOT_STAGES = ['run', 'load_toc', 'load_usx', 'process_front_matter', 'process_chapters_parallel']
+    SPLITTER_ATTRIBUTE = 'memory_tracker'
+    
+    def __init__(self, label=None):
+        super().__init__()
+        # (stage, chapter, peak bytes, retained bytes) of every call
+        self.records = []
+        self.label = label or f"process {os.getpid()}"
+        # Peak of the outermost stages of each process or book
+        self.peaks = {}
+        # Peak resident set size of each process or book, when the platform reports it
+        self.rss = {}
+        # Bytes and blocks retained by each allocation site, per snapshot stage
+        self.sites = {}
+        # [allocated at start, peak so far, snapshot] of every stage under way
+        self.open = []
+        self.started_tracing = False
+        
+    def __enter__(self):
+        self.start()
+        return self
+        
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+        
+    def start(self):
+        """Start tracing, unless it already runs, and open the run stage."""
+        self.started_tracing = not tracemalloc.is_tracing()
+        if self.started_tracing:
+            tracemalloc.start()
+        self._start('run')
+        
+    def stop(self):
+        """Close the run stage and stop tracing if start began it."""
+        self._finish('run', None)
+        if self.started_tracing:
+            tracemalloc.stop()
+            
+    def _start(self, stage):
+        """Open a stage, resetting the traced peak so that it measures this stage."""
+        snapshot = self._snapshot() if stage in self.SNAPSHOT_STAGES else None
+        current, peak = tracemalloc.get_traced_memory()
+        if self.open:
+            # Keep the peak of the enclosing stage before it is reset
+            self.open[-1][1] = max(self.open[-1][1], peak)
+        tracemalloc.reset_peak()
+        self.open.append([current, current, snapshot])
+        
+    def _finish(self, stage, started):
+        """Close the innermost stage and record its peak and retained memory."""
+        start_current, peak, snapshot = self.open.pop()
+        current, traced_peak = tracemalloc.get_traced_memory()
+        peak = max(peak, traced_peak)
+        self.records.append((stage, self.chapter, peak - start_current, current - start_current))
+        if self.open:
+            self.open[-1][1] = max(self.open[-1][1], peak)
+        else:
+            self.peaks[self.label] = max(self.peaks.get(self.label, 0), peak - start_current)
+            rss = _peak_rss()
+            if rss is not None:
+                self.rss[self.label] = max(self.rss.get(self.label, 0), rss)
+        if snapshot is not None:
+            sites = self.sites.setdefault(stage, {})
+            for diff in self._snapshot().compare_to(snapshot, 'lineno'):
+                if diff.size_diff > 0:
+                    frame = diff.traceback[0]
+                    site = f"{frame.filename}:{frame.lineno}"
+                    size, count = sites.get(site, (0, 0))
+                    sites[site] = (size + diff.size_diff, count + diff.count_diff)
+                    
+    @staticmethod
+    def _snapshot():
+        """Take a snapshot of the traced memory without tracemalloc's own allocations."""
+        return tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+        
+    def export(self):
+        """Return the records, peaks, resident set sizes and sites in a picklable form for merge."""
+        return {'records': self.records, 'peaks': self.peaks, 'rss': self.rss, 'sites': self.sites}
+        
+    def merge(self, exported, label=None):
+        """Add the export of a worker's tracker, naming its peak and prefixing its chapters with label if given.
+        
+        The worker's run stage is left out of the stages; it shows in the peaks.
+        """
+        for stage, chapter, peak, retained in exported['records']:
+            if stage == 'run':
+                continue
+            if label is not None and chapter is not None:
+                chapter = f"{label} {chapter}"
+            self.records.append((stage, chapter, peak, retained))
+        for name, peak in exported['peaks'].items():
+            name = label or name
+            self.peaks[name] = max(self.peaks.get(name, 0), peak)
+        for name, rss in exported['rss'].items():
+            name = label or name
+            self.rss[name] = max(self.rss.get(name, 0), rss)
+        for stage, sites in exported['sites'].items():
+            merged = self.sites.setdefault(stage, {})
+            for site, (size, count) in sites.items():
+                total_size, total_count = merged.get(site, (0, 0))
+                merged[site] = (total_size + size, total_count + count)
+                
+    def summary(self, limit=10):
+        """Return the memory of every stage and chapter, the peaks and the top allocation sites as a JSON-ready dict.
+        
+        Sizes are in bytes. The rss peaks are of whole processes: a worker
+        that split several books reports its peak so far for each of them. Stage and chapter peaks are the largest of their
+        calls; retained memory is summed over the calls.
+        """
+        stages = {}
+        chapters = {}
+        for stage, chapter, peak, retained in self.records:
+            stages.setdefault(stage, []).append((peak, retained))
+            if stage in ('process_chapter', 'process_front_matter'):
+                chapters.setdefault(str(chapter), []).append((peak, retained))
+                
+        def stats(calls):
+            peaks = sorted(peak for peak, _ in calls)
+            return {
+                'count': len(calls),
+                'peak': peaks[-1],
+                'peak_p95': _percentile(peaks, 95),
+                'retained': sum(retained for _, retained in calls),
+            }
+            
+        return {
+            'peaks': dict(sorted(self.peaks.items(), key=lambda item: -item[1])),
+            'rss': dict(sorted(self.rss.items(), key=lambda item: -item[1])),
+            'stages': {stage: stats(stages[stage]) for stage in ['run'] + self.STAGES if stage in stages},
+            'chapters': {chapter: stats(calls) for chapter, calls in chapters.items()},
+            'sites': {
+                stage: [{'site': site, 'size': size, 'count': count}
+                        for site, (size, count) in sorted(sites.items(), key=lambda item: -item[1][0])[:limit]]
+                for stage, sites in self.sites.items()
+            },
+        }
+        
+    def report(self, limit=10):
+        """Return the summary as text: peaks, a table of stages, a table of chapters and the top allocation sites."""
+        summary = self.summary(limit)
+        lines = [f"Peak {name}: {peak / 1024:.1f} KB" for name, peak in summary['peaks'].items()]
+        lines += [f"Peak RSS {name}: {rss / 1024:.1f} KB" for name, rss in summary['rss'].items()]
+        
+        rows = [['stage', 'calls', 'peak KB', 'p95 KB', 'retained KB']]
+        for stage, stats in summary['stages'].items():
+            rows.append([stage, str(stats['count']), f"{stats['peak'] / 1024:.1f}",
+                         f"{stats['peak_p95'] / 1024:.1f}", f"{stats['retained'] / 1024:.1f}"])
+        lines += [''] + self._table(rows)
+        
+        rows = [['chapter', 'peak KB', 'retained KB']]
+        for chapter, stats in sorted(summary['chapters'].items(), key=lambda item: -item[1]['peak']):
+            rows.append([chapter, f"{stats['peak'] / 1024:.1f}", f"{stats['retained'] / 1024:.1f}"])
+        if len(rows) > 1:
+            lines += [''] + self._table(rows)
+            
+        for stage, sites in summary['sites'].items():
+            if sites:
+                lines += ['', f"Largest allocation sites retained by {stage}:"]
+                lines += [f"  {site['size'] / 1024:10.1f} KB {site['count']:8d} blocks  {site['site']}" for site in sites]
+        return '\n'.join(lines)
+
+
+class Profiler:
+    """Profile a run with cProfile, or by sampling the stack on a CPU-time timer.
+    
+    The 'cprofile' mode traces every call. The 'sample' mode records the
+    Python stack every interval seconds of CPU time through SIGPROF, which
+    costs far less on large books, but needs a Unix platform and only sees
+    the main thread. Either way save writes a pstats file to path, which
+    pstats and snakeviz can load. Worker processes profile themselves into
+    files next to it, named <stem>.<pid><suffix>, listed in worker_paths.
+    """
+    
+    MODES = ['cprofile', 'sample']
+    
+    # Profiler running in this process; forked workers inherit it and stop it
+    active = None
+    
+    def __init__(self, path, mode='cprofile', interval=0.001):
+        if mode == 'sample' and not hasattr(signal, 'setitimer'):
+            raise ValueError("Sampling needs signal timers, which this platform lacks")
+        self.path = Path(path)
+        self.mode = mode
+        self.interval = interval
+        self.profile = cProfile.Profile() if mode == 'cprofile' else None
+        # (samples, CPU seconds) of each stack sampled, innermost frame first
+        self.samples = {}
+        self.sampled_at = None
+        self.worker_paths = []
+        
+    def __enter__(self):
+        self.start()
+        return self
+        
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+        
+    def start(self):
+        """Start or resume profiling."""
+        if self.profile is not None:
+            self.profile.enable()
+        else:
+            self.sampled_at = time.process_time()
+            signal.signal(signal.SIGPROF, self._sample)
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        Profiler.active = self
+        
+    def stop(self):
+        """Pause profiling."""
+        if self.profile is not None:
+            self.profile.disable()
+        else:
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, signal.SIG_DFL)
+        Profiler.active = None
+        
+    def _sample(self, signum, frame):
+        """Count the stack running when the timer fired."""
+        # The timer fires at the kernel's tick at best, so each sample is
+        # weighted by the CPU time since the last one, not by the interval
+        now = time.process_time()
+        seconds = now - self.sampled_at
+        self.sampled_at = now
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+            frame = frame.f_back
+        stack = tuple(stack)
+        count, total = self.samples.get(stack, (0, 0.0))
+        self.samples[stack] = (count + 1, total + seconds)
+        
+    def sample_stats(self):
+        """Return the samples as a pstats dict, with one call per sample a function appears in."""
+        stats = {}
+        callers = {}
+        for stack, (count, seconds) in self.samples.items():
+            seen = set()
+            for i, function in enumerate(stack):
+                calls, own, cumulative = stats.get(function, (0, 0.0, 0.0))
+                if i == 0:
+                    own += seconds
+                if function not in seen:
+                    # Recursive functions count once per sample
+                    seen.add(function)
+                    calls += count
+                    cumulative += seconds
+                stats[function] = (calls, own, cumulative)
+                if i + 1 < len(stack):
+                    caller = callers.setdefault(function, {})
+                    caller_calls, _, caller_own, caller_cumulative = caller.get(stack[i + 1], (0, 0, 0.0, 0.0))
+                    caller[stack[i + 1]] = (caller_calls + count, caller_calls + count,
+                                            caller_own + (seconds if i == 0 else 0.0), caller_cumulative + seconds)
+        return {function: (calls, calls, own, cumulative, callers.get(function, {}))
+                for function, (calls, own, cumulative) in stats.items()}
+        
+    def save(self):
+        """Write the profile gathered so far to path."""
+        if self.profile is not None:
+            self.profile.dump_stats(str(self.path))
+        else:
+            with open(self.path, 'wb') as f:
+                marshal.dump(self.sample_stats(), f)
+                
+    def worker_settings(self):
+        """Return the picklable settings a worker process needs to profile itself."""
+        return (str(self.path), self.mode, self.interval)
+        
+    def hotspots(self, limit=20):
+        """Return the functions that took the most time of their own, across this profile and the workers'."""
+        output = io.StringIO()
+        stats = pstats.Stats(stream=output)
+        for path in [self.path] + self.worker_paths:
+            # pstats refuses empty profiles, such as that of a parent that sampled only waiting
+            with open(path, 'rb') as f:
+                if marshal.load(f):
+                    stats.add(str(path))
+        stats.sort_stats('tottime').print_stats(limit)
+        return output.getvalue()
+
+
+# Profiler of this worker process, created by the first task that needs one
+_worker_profiler = None
+
+
+def _profile_worker(settings):
+    """Return the Profiler of this worker process for Profiler.worker_settings, creating it on first use."""
+    global _worker_profiler
+    if _worker_profiler is None:
+        if Profiler.active is not None:
+            # A forked worker inherits the profiler of its parent
+            Profiler.active.stop()
+        path, mode, interval = settings
+        path = Path(path)
+        _worker_profiler = Profiler(path.with_name(f"{path.stem}.{os.getpid()}{path.suffix}"), mode, interval)
+    return _worker_profiler
+
+
+class USXWriter:
+    """Serialize USX documents straight to indented UTF-8 bytes.
+    
+    The output is what indenting the document with two spaces per level and
+    writing it with ElementTree would produce, but it comes from a single
+    traversal of the source elements, which are left unmodified.
+    """
+    
+    XML_DECLARATION = b"<?xml version='1.0' encoding='utf-8'?>\n"
+    USX_START = b'<usx version="3.0">'
+    USX_EMPTY = b'<usx version="3.0" />'
+    USX_END = b'</usx>\n'
+    
+    def __init__(self, book_code, book_title):
+        self.book_code = book_code
+        self.book_line = (
+            f'\n  <book code="{_escape_attrib(book_code)}" style="id">{_escape_text(book_title)}</book>'
+        ).encode('utf-8')
+    
+    def document(self, content, book=False, chapter_end=None):
+        """Return the bytes of a USX document holding the given top-level elements.
+        
+        With book=True the document starts with the book identification line,
+        and chapter_end appends a chapter end marker with that eid.
+        """
+        children = [element for element in content if element is not None]
+        if not children and not book and chapter_end is None:
+            return self.XML_DECLARATION + self.USX_EMPTY
+            
+        parts = []
+        for i, element in enumerate(children):
+            last = chapter_end is None and i == len(children) - 1
+            self._write_element(parts, element, 1, last)
+        if chapter_end is not None:
+            parts.append(f'<chapter eid="{_escape_attrib(chapter_end)}" />\n')
+            
+        head = [self.XML_DECLARATION, self.USX_START]
+        if book:
+            head.append(self.book_line)
+        head.append(b'\n  ' if parts else b'\n')
+        data = b''.join(head + [''.join(parts).encode('utf-8'), self.USX_END])
+        WORK_COUNTERS.bytes_serialized += len(data)
+        return data
+    
+    def assemble(self, pieces, book=False, chapter_end=None):
+        """Return the bytes of a USX document made of already serialized top-level elements.
+        
+        Each piece is copied as is onto its own indented line; book and
+        chapter_end work as for document.
+        """
+        if not pieces and not book and chapter_end is None:
+            return self.XML_DECLARATION + self.USX_EMPTY
+            
+        parts = [self.XML_DECLARATION, self.USX_START]
+        if book:
+            parts.append(self.book_line)
+        for piece in pieces:
+            parts.append(b'\n  ')
+            parts.append(piece)
+        if chapter_end is not None:
+            parts.append(f'\n  <chapter eid="{_escape_attrib(chapter_end)}" />'.encode('utf-8'))
+        parts.append(b'\n' + self.USX_END)
+        data = b''.join(parts)
+        WORK_COUNTERS.bytes_serialized += len(data)
+        return data
+    
+    def _write_element(self, parts, elem, level, last):
+        """Append the markup of an element and its tail at the given depth."""
+        tag = elem.tag
+        parts.append('<' + tag)
+        for name, value in elem.items():
+            parts.append(f' {name}="{_escape_attrib(value)}"')
+            
+        text = elem.text
+        count = len(elem)
+        if count:
+            # Whitespace-only text is replaced with the indentation of the first child
+            if not text or not text.strip():
+                text = '\n' + '  ' * (level + 1)
+            parts.append('>' + _escape_text(text))
+            for i, child in enumerate(elem):
+                self._write_element(parts, child, level + 1, i == count - 1)
+            parts.append(f'</{tag}>')
+        elif text:
+            parts.append(f'>{_escape_text(text)}</{tag}>')
+        else:
+            parts.append(' />')
+            
+        # Whitespace-only tails become the indentation of the next sibling,
+        # or of the closing parent tag after the last child
+        tail = elem.tail
+        if not tail or not tail.strip():
+            tail = '\n' + '  ' * (level - 1 if last else level)
+        parts.append(_escape_text(tail))
+
+
+BACKENDS = {
+    'stdlib': ElementTreeBackend,
+    'lxml': LxmlBackend,
+}
+
+
+def get_backend(name='auto'):
+    """Return an XML backend by name, preferring lxml for 'auto' when it is installed."""
+    if name == 'auto':
+        name = 'lxml' if lxml_etree is not None else 'stdlib'
+    if name == 'lxml' and lxml_etree is None:
+        raise ImportError("The lxml backend was requested but lxml is not installed")
+    return BACKENDS[name]()
+
+
+class DirectorySink:
+    """Output sink that writes chunk files into a directory tree."""
+    
+    # Worker processes may write into the sink themselves
+    concurrent_writes = True
+    
+    def __init__(self, output_dir):
+        self.output_dir = Path(output_dir)
+    
+    def open(self):
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+    
+    def add_directory(self, path):
+        """Create a directory, given relative to the output root."""
+        (self.output_dir / path).mkdir(parents=True, exist_ok=True)
+    
+    def write(self, path, data):
+        """Write a file, given relative to the output root."""
+        file_path = self.output_dir / path
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.write_bytes(data)
+    
+    def exists(self, path):
+        """Return whether a file, given relative to the output root, exists."""
+        return (self.output_dir / path).is_file()
+    
+    def close(self):
+        pass
+
+
+class ArchiveSink:
+    """Base class for output sinks that stream all chunk files into one archive.
+    
+    Entries are written in the order they are produced, with fixed timestamps
+    and permissions, and directory entries mirror the layout DirectorySink
+    would create.
+    """
+    
+    concurrent_writes = False
+    
+    def __init__(self, archive_path):
+        self.archive_path = Path(archive_path)
+        self.directories = set()
+    
+    def open(self):
+        self.archive_path.parent.mkdir(parents=True, exist_ok=True)
+    
+    def add_directory(self, path):
+        """Add a directory entry and those of its parents, once each."""
+        parts = PurePosixPath(path).parts
+        for i in range(1, len(parts) + 1):
+            directory = '/'.join(parts[:i])
+            if directory not in self.directories:
+                self.directories.add(directory)
+                self.write_directory(directory)
+    
+    def write(self, path, data):
+        """Add a file entry, given relative to the archive root."""
+        parent = str(PurePosixPath(path).parent)
+        if parent != '.':
+            self.add_directory(parent)
+        self.write_file(str(PurePosixPath(path)), data)
+
+
+class ZipSink(ArchiveSink):
+    """Output sink that writes all chunk files into a single zip archive."""
+    
+    # The earliest timestamp a zip entry can carry
+    DATE_TIME = (1980, 1, 1, 0, 0, 0)
+    
+    def open(self):
+        super().open()
+        self.archive = zipfile.ZipFile(self.archive_path, 'w', zipfile.ZIP_DEFLATED)
+    
+    def write_directory(self, directory):
+        info = zipfile.ZipInfo(directory + '/', date_time=self.DATE_TIME)
+        info.external_attr = (0o40755 << 16) | 0x10
+        self.archive.writestr(info, b'')
+    
+    def write_file(self, path, data):
+        info = zipfile.ZipInfo(path, date_time=self.DATE_TIME)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        info.external_attr = 0o644 << 16
+        self.archive.writestr(info, data)
+    
+    def close(self):
+        self.archive.close()
+
+
+class TarSink(ArchiveSink):
+    """Output sink that writes all chunk files into a single tar archive, gzipped for .tar.gz/.tgz."""
+    
+    def open(self):
+        super().open()
+        self.file = open(self.archive_path, 'wb')
+        self.gzip_file = None
+        fileobj = self.file
+        if self.archive_path.name.endswith(('.tar.gz', '.tgz')):
+            # A fixed gzip header timestamp keeps the archive reproducible
+            self.gzip_file = gzip.GzipFile(filename='', mode='wb', fileobj=self.file, mtime=0)
+            fileobj = self.gzip_file
+        self.archive = tarfile.open(fileobj=fileobj, mode='w', format=tarfile.PAX_FORMAT)
+    
+    def _tar_info(self, name, mode):
+        info = tarfile.TarInfo(name)
+        info.mtime = 0
+        info.mode = mode
+        return info
+    
+    def write_directory(self, directory):
+        info = self._tar_info(directory, 0o755)
+        info.type = tarfile.DIRTYPE
+        self.archive.addfile(info)
+    
+    def write_file(self, path, data):
+        info = self._tar_info(path, 0o644)
+        info.size = len(data)
+        self.archive.addfile(info, io.BytesIO(data))
+    
+    def close(self):
+        self.archive.close()
+        if self.gzip_file is not None:
+            self.gzip_file.close()
+        self.file.close()
+
+
+class MemorySink:
+    """Output sink that keeps entries in memory, for replaying them into another sink.
+    
+    Worker processes use it when the parent's sink cannot take concurrent
+    writes. Directory entries are recorded with data None.
+    """
+    
+    concurrent_writes = False
+    
+    def __init__(self):
+        self.entries = []
+    
+    def open(self):
+        pass
+    
+    def add_directory(self, path):
+        self.entries.append((path, None))
+    
+    def write(self, path, data):
+        self.entries.append((path, data))
+    
+    def close(self):
+        pass
+
+
+def replay_entries(entries, sink):
+    """Write the entries collected by a MemorySink into another sink."""
+    for path, data in entries:
+        if data is None:
+            sink.add_directory(path)
+        else:
+            sink.write(path, data)
+
+
+def open_sink(output_path):
+    """Return the output sink for a path: an archive for .zip/.tar/.tar.gz/.tgz, otherwise a directory."""
+    name = str(output_path).lower()
+    if name.endswith('.zip'):
+        return ZipSink(output_path)
+    if name.endswith(('.tar', '.tar.gz', '.tgz')):
+        return TarSink(output_path)
+    return DirectorySink(output_path)
+
+
+def _update_digest(digest, element):
+    """Feed an element, its descendants and its tail into a hash."""
+    digest.update(repr((element.tag, element.items(), element.text, element.tail)).encode('utf-8'))
+    for child in element:
+        _update_digest(digest, child)
+
+
+class BuildManifest:
+    """Content-hash manifest of the files in an output directory.
+    
+    Each file is mapped to a hash of everything it is generated from: its
+    source elements, its TOC entry and the fixed document parts. A file whose
+    hash is unchanged since the previous run, and which still exists, is
+    neither serialized nor rewritten.
+    """
+    
+    FILENAME = '.usx_manifest.json'
+    # Bump when a change to the splitter alters the output for the same inputs
+    VERSION = 1
+    
+    def __init__(self, previous=None):
+        self.previous = previous or {}
+        self.entries = dict(self.previous)
+        self.reused = 0
+    
+    @classmethod
+    def load(cls, output_dir):
+        """Load the manifest of the previous run in output_dir, if any."""
+        path = Path(output_dir) / cls.FILENAME
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return cls()
+        if data.get('version') != cls.VERSION:
+            return cls()
+        return cls(data.get('files', {}))
+    
+    def save(self, output_dir):
+        """Write the manifest into output_dir, replacing the previous one."""
+        path = Path(output_dir) / self.FILENAME
+        temp_path = path.with_name(path.name + '.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': self.VERSION, 'files': self.entries}, f, indent=1, sort_keys=True)
+        os.replace(temp_path, path)
+    
+    def source_key(self, content, *inputs):
+        """Return the hash of a document's source elements and other inputs."""
+        digest = hashlib.sha256(repr(inputs).encode('utf-8'))
+        for element in content:
+            if element is not None:
+                _update_digest(digest, element)
+        return digest.hexdigest()
+    
+    def data_key(self, data, *inputs):
+        """Return the hash of an already assembled document and other inputs."""
+        digest = hashlib.sha256(repr(inputs).encode('utf-8'))
+        digest.update(data)
+        return digest.hexdigest()
+    
+    def is_current(self, path, key, sink):
+        """Return whether the file at path was already generated from the inputs with this key."""
+        if self.previous.get(path) == key and sink.exists(path):
+            self.reused += 1
+            return True
+        return False
+    
+    def record(self, path, key):
+        self.entries[path] = key
+    
+    def subset(self, prefix):
+        """Return the previous entries whose paths start with prefix."""
+        return {path: key for path, key in self.previous.items() if path.startswith(prefix)}
+    
+    def merge(self, entries, reused):
+        """Take over the entries recorded and the reuse count of a worker's manifest."""
+        self.entries.update(entries)
+        self.reused += reused
+
+
+class ParseCache:
+    """On-disk cache of parsed inputs, keyed by a hash of their content.
+    
+    Entries are stored in marshal format. Reading an entry marks it as
+    recently used, and the least recently used entries are evicted once the
+    cache grows beyond max_bytes.
+    """
+    
+    # Bump when the layout of cached entries changes
+    VERSION = 3
+    
+    def __init__(self, cache_dir, max_bytes=256 * 1024 * 1024):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+    
+    def key(self, kind, data):
+        """Return the cache key of an input of the given kind with content data."""
+        digest = hashlib.sha256(f"{self.VERSION}:{marshal.version}:{kind}:".encode('ascii'))
+        digest.update(data)
+        return f"{kind}-{digest.hexdigest()}"
+    
+    def get(self, key):
+        """Return the cached value for key, or None on a miss."""
+        path = self.cache_dir / f"{key}.bin"
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+            return marshal.loads(data)
+        except FileNotFoundError:
+            return None
+        except (EOFError, ValueError, TypeError):
+            # A damaged entry is treated as a miss and replaced on the next put
+            return None
+    
+    def put(self, key, value):
+        """Store a value and evict old entries if the cache is over its size cap."""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self.cache_dir / f"{key}.bin"
+        temp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        temp_path.write_bytes(marshal.dumps(value))
+        os.replace(temp_path, path)
+        self.evict()
+    
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        for path in self.cache_dir.glob('*.bin'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            with contextlib.suppress(FileNotFoundError):
+                path.unlink()
+            total -= size
+
+
+def _join_ranges(data, ranges):
+    """Join byte ranges of USX bytes inside a synthetic root."""
+    return b''.join([b'<usx>'] + [data[start:end] for start, end in ranges] + [b'</usx>'])
+
+
+def _scan_attributes(attributes):
+    """Return the attributes of a start tag, given as bytes, as a dict of strings."""
+    return {match.group(1).decode('utf-8'): (match.group(2) or match.group(3) or b'').decode('utf-8')
+            for match in XML_ATTRIBUTE_PATTERN.finditer(attributes)}
+
+
+def _map_usx(source, engine):
+    """Memory-map an open USX source, or read it when it cannot be mapped, and check that it is UTF-8.
+    
+    engine names the engine that works on the source bytes, for the error
+    raised when they are in another encoding.
+    """
+    try:
+        data = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, io.UnsupportedOperation):
+        # Zip members and in-memory sources cannot be mapped, so they are read into memory
+        data = source.read()
+        
+    match = XML_ENCODING_PATTERN.match(data)
+    if match and match.group(1).lower() not in (b'utf-8', b'utf8'):
+        if isinstance(data, mmap.mmap):
+            data.close()
+        raise ValueError(f"The {engine} engine needs UTF-8 USX, not {match.group(1).decode('ascii')}")
+    return data
+
+
+def _root_start(data):
+    """Return the XML_TAG_PATTERN match of the root start tag of XML bytes, or None."""
+    for match in XML_TAG_PATTERN.finditer(data):
+        if match.group(2) is not None:
+            return match
+    return None
+
+
+def scan_chapter_offsets(data):
+    """Find the byte ranges of the front matter and chapters of USX bytes from their chapter milestones.
+    
+    Only the chapter markers are searched for, skipping those in comments
+    and CDATA sections; nothing is parsed. Returns (front, chapters), where
+    front is the (start, end) range of the root's content before the first
+    chapter, and chapters maps each chapter number to a list of (start, end)
+    ranges, normally one, running from the chapter's start marker through
+    its end marker. A chapter without an end marker runs up to the next
+    chapter or the end of the root. Raises ValueError for a start marker
+    without a number.
+    """
+    root = _root_start(data)
+    if root is None:
+        return (0, 0), {}
+    content_start = root.end()
+    if root.group(4):
+        return (content_start, content_start), {}
+    content_end = data.rfind(b'</' + root.group(2))
+    if content_end < content_start:
+        content_end = len(data)
+        
+    front = None
+    chapters = {}
+    start = None
+    chapter_num = None
+    for match in CHAPTER_SCAN_PATTERN.finditer(data, content_start, content_end):
+        if match.group(1) is None:
+            # A comment or CDATA section
+            continue
+        attrib = _scan_attributes(match.group(1))
+        if 'eid' not in attrib:
+            if 'number' not in attrib:
+                raise ValueError(f"Chapter start marker without a number at byte {match.start()}")
+            if front is None:
+                front = (content_start, match.start())
+            if start is not None:
+                chapters[chapter_num].append((start, match.start()))
+            chapter_num = int(attrib['number'])
+            chapters.setdefault(chapter_num, [])
+            start = match.start()
+        elif start is not None:
+            chapters[chapter_num].append((start, match.end()))
+            start = None
+            
+    if start is not None:
+        chapters[chapter_num].append((start, content_end))
+    return front or (content_start, content_end), chapters
+
+
+def scan_book_offsets(data):
+    """Find the byte ranges of the books of multi-book USX bytes from their book elements.
+    
+    Only the book elements and root end tags are searched for, skipping
+    those in comments and CDATA sections; nothing is parsed. Returns (root
+    start tag, root end tag, books), where books lists a (book code, start,
+    end) range for each book, running from its book element to the next
+    one, or to the end of the root holding it when the books are
+    concatenated USX documents. Each range wrapped in the root tags is a
+    single-book USX document.
+    """
+    root = _root_start(data)
+    if root is None or root.group(4):
+        return b'<usx>', b'</usx>', []
+    root_end = b'</' + root.group(2) + b'>'
+    pattern = re.compile(BOOK_SCAN_PATTERN % re.escape(root.group(2)), re.S)
+    
+    books = []
+    for match in pattern.finditer(data, root.end()):
+        attributes, end_tag = match.groups()
+        if attributes is None and end_tag is None:
+            # A comment or CDATA section
+            continue
+        if books and books[-1][2] is None:
+            # A book runs up to the next book or the end of its root
+            books[-1][2] = match.start()
+        if attributes is not None:
+            books.append([_scan_attributes(attributes).get('code', ''), match.start(), None])
+            
+    return root.group(0), root_end, [
+        (code, start, end if end is not None else len(data)) for code, start, end in books]
+
+
+class Selection:
+    """A set of numbers and names given as a string such as '3,5-9' or 'title,7'.
+    
+    names lists the words the selection may hold besides numbers and ranges.
+    Raises ValueError for malformed selections.
+    """
+    
+    def __init__(self, spec, names=()):
+        self.ranges = []
+        self.names = set()
+        for part in spec.split(','):
+            part = part.strip()
+            if part in names:
+                self.names.add(part)
+                continue
+            match = re.fullmatch(r'(\d+)(?:-(\d+))?', part)
+            if match is None:
+                raise ValueError(f"Invalid selection {spec!r}")
+            first = int(match.group(1))
+            last = int(match.group(2)) if match.group(2) else first
+            if last < first:
+                raise ValueError(f"Invalid range {part!r} in selection {spec!r}")
+            self.ranges.append((first, last))
+    
+    def __contains__(self, value):
+        if isinstance(value, str):
+            return value in self.names
+        return any(first <= value <= last for first, last in self.ranges)
+
+
+class Chunk(namedtuple('Chunk', ['chapter', 'chunk', 'verse_range', 'data'])):
+    """One output document of a split book.
+    
+    chapter is 'front' or a chapter number, and chunk is 'title' or the
+    chunk's start verse. verse_range is the (start verse, end verse) the
+    chunk covers, with None as the end of the last chunk of a chapter, or
+    None for title documents. data holds the USX bytes.
+    """
+    
+    __slots__ = ()
+    
+    @property
+    def path(self):
+        """The path of the chunk's file in an output directory."""
+        if self.chapter == 'front':
+            return "front/title.usx"
+        if self.chunk == 'title':
+            return f"{self.chapter:02d}/title.usx"
+        return f"{self.chapter:02d}/{self.chunk:02d}.usx"
+
+
+class ParagraphPiece:
+    """The part of a source paragraph that falls in one chunk.
+    
+    Holds the source paragraph and references to the children it keeps, and
+    reads like an element to USXWriter, so chunks are built without copying
+    or re-parenting source nodes.
+    """
+    
+    tail = None
+    
+    def __init__(self, paragraph, text=None):
+        self.paragraph = paragraph
+        self.text = text
+        self.children = []
+    
+    @property
+    def tag(self):
+        return self.paragraph.tag
+    
+    def get(self, name, default=None):
+        return self.paragraph.get(name, default)
+    
+    def items(self):
+        return self.paragraph.items()
+    
+    def append(self, child):
+        self.children.append(child)
+    
+    def __len__(self):
+        return len(self.children)
+    
+    def __iter__(self):
+        return iter(self.children)
+
+
+class CountedElement:
+    """A parsed book root whose iteration counts the children it yields.
+    
+    Every pass over the top-level elements of the book, wherever it is made,
+    adds to WORK_COUNTERS.elements_visited, so a rescan of the book per
+    chapter shows up as non-linear work. Anything else goes to the element.
+    """
+    
+    def __init__(self, element):
+        self.element = element
+    
+    def __getattr__(self, name):
+        return getattr(self.element, name)
+    
+    def __len__(self):
+        return len(self.element)
+    
+    def __iter__(self):
+        for child in self.element:
+            WORK_COUNTERS.elements_visited += 1
+            yield child
 
 
 class USXSplitter:
-    def __init__(self, usx_file_path, toc_file_path, output_dir):
+    # Rough memory held by a loaded book per byte of USX source
+    MEMORY_PER_SOURCE_BYTE = 12
+    
+    def __init__(self, usx_file_path, toc_file_path, output_dir, backend=None, jobs=1,
+                 book_code=None, book_title=None, usx_member=None, sink=None, incremental=True,
+                 cache=None, chapters=None, chunks=None, log=print):
         self.usx_file_path = usx_file_path
+        self.usx_member = usx_member
         self.toc_file_path = toc_file_path
-        self.output_dir = Path(output_dir)
+        # Without an output_dir the splitter can only yield chunks from iter_chunks
+        self.output_dir = Path(output_dir) if output_dir is not None else None
+        self.sink = sink or (open_sink(output_dir) if output_dir is not None else None)
+        self.backend = backend or get_backend()
+        self.jobs = jobs
+        self.book_code = book_code
+        self.book_title = book_title
+        self.writer = None
+        self.incremental = incremental
+        self.manifest = None
+        self.cache = cache
+        # Selections of the chapters and chunks to process, or None for all
+        self.chapters = chapters
+        self.chunks = chunks
         self.toc_data = None
         self.usx_content = None
+        self.front_content = []
+        self.chapter_index = {}
+        # Source bytes and byte ranges of the chapters not parsed yet, when
+        # the chapter index comes from the parse cache
+        self.usx_data = None
+        self.chapter_offsets = {}
+        # StageTimer timing this splitter and MemoryTracker tracking its
+        # memory, set by their instrument methods
+        self.stage_timer = None
+        self.memory_tracker = None
+        # Profiler of the run, whose settings are passed on to worker processes
+        self.profiler = None
+        # Called like print with the progress messages of the split
+        self.log = log
         
     def load_toc(self):
-        """Load and parse the TOC YAML file."""
-        with open(self.toc_file_path, 'r', encoding='utf-8') as f:
-            self.toc_data = yaml.safe_load(f)
-        print(f"Loaded TOC with {len(self.toc_data)} chapters")
+        """Load the TOC and normalize its chapter and chunk numbers.
+        
+        An up-to-date compiled TOC is used when present; otherwise the YAML is
+        loaded from the parse cache or with libyaml when available.
+        """
+        data = Path(self.toc_file_path).read_bytes()
+        self.toc_data = load_compiled_toc(self.toc_file_path, data, log=self.log)
+        
+        if self.toc_data is None:
+            key = None
+            if self.cache is not None:
+                key = self.cache.key('toc', data)
+                self.toc_data = self.cache.get(key)
+            if self.toc_data is None:
+                self.toc_data = normalize_toc(yaml.load(data, Loader=YAML_LOADER))
+                if key is not None:
+                    self.cache.put(key, self.toc_data)
+        self.log(f"Loaded TOC with {len(self.toc_data)} chapters")
+        
+        if self.chapters is not None or self.chunks is not None:
+            self.toc_data = self.select_toc(self.toc_data)
+            self.log(f"Selected {len(self.toc_data)} chapters")
+        
+    def select_toc(self, toc_data):
+        """Return the TOC entries of the selected chapters.
+        
+        The front matter only has a title, so it is left out when titles are
+        not among the selected chunks.
+        """
+        selected = []
+        for chapter_info in toc_data:
+            if self.chapters is not None and chapter_info['chapter'] not in self.chapters:
+                continue
+            if chapter_info['chapter'] == 'front' and self.chunks is not None and 'title' not in self.chunks:
+                continue
+            selected.append(chapter_info)
+        return selected
+    
+    def selected_chunks(self, chunks):
+        """Return the selected chunks of a TOC entry."""
+        if self.chunks is None:
+            return chunks
+        return [chunk for chunk in chunks if chunk in self.chunks]
+        
+    @contextlib.contextmanager
+    def open_usx(self):
+        """Open the USX source for binary reading, streaming it from a zip member if one was given.
+        
+        The source can also be a binary file object, which is left open.
+        """
+        if hasattr(self.usx_file_path, 'read'):
+            yield self.usx_file_path
+        elif self.usx_member is None:
+            with open(self.usx_file_path, 'rb') as f:
+                yield f
+        else:
+            with zipfile.ZipFile(self.usx_file_path) as archive, archive.open(self.usx_member) as f:
+                yield f
         
     def load_usx(self):
-        """Load and parse the USX XML file."""
-        tree = ET.parse(self.usx_file_path)
-        self.usx_content = tree.getroot()
-        print(f"Loaded USX file: {self.usx_content.tag}")
+        """Load and parse the USX XML file, or find its selected chapters through the parse cache.
+        
+        With a cache and a chapter selection, the byte ranges of the chapters
+        are cached rather than their elements, and each chapter is parsed from
+        its range when chapter_elements first asks for it. A whole book is
+        parsed in one go, which the C parsers do faster than chapter by chapter.
+        """
+        if self.cache is None or self.chapters is None:
+            with self.open_usx() as source:
+                self.usx_content = CountedElement(self.backend.parse(source))
+            self.log(f"Loaded USX file: {self.usx_content.tag} ({self.backend.name} backend)")
+            self.build_chapter_index()
+            return
+            
+        with self.open_usx() as source:
+            data = source.read()
+        match = XML_ENCODING_PATTERN.match(data)
+        if data.startswith((b'\xff\xfe', b'\xfe\xff')) or (match and match.group(1).lower() not in (b'utf-8', b'utf8')):
+            # Chapter ranges are parsed without the XML declaration, so they must be UTF-8
+            self.usx_content = CountedElement(self.backend.fromstring(data))
+            self.log(f"Loaded USX file: {self.usx_content.tag} ({self.backend.name} backend)")
+            self.build_chapter_index()
+            return
+            
+        key = self.cache.key('usx', data)
+        offsets = self.cache.get(key)
+        if offsets is None:
+            offsets = scan_chapter_offsets(data)
+            self.cache.put(key, offsets)
+        else:
+            self.log("Loaded chapter index from cache")
+        self.load_offsets(data, *offsets)
+        
+    def load_offsets(self, data, front, chapter_offsets):
+        """Parse the front matter of a book from its bytes and keep the byte ranges of its chapters."""
+        self.usx_content = None
+        self.usx_data = data
+        self.chapter_offsets = dict(chapter_offsets)
+        self.chapter_index = {}
+        self.front_content = self.parse_ranges([front])
+        self.log(f"Indexed {len(self.chapter_offsets)} chapters from their markers")
+        self.load_book_info(self.front_content)
+        
+    def parse_ranges(self, ranges):
+        """Parse byte ranges of the source inside a synthetic root and return its children."""
+        content = list(self.backend.fromstring(_join_ranges(self.usx_data, ranges)))
+        WORK_COUNTERS.elements_visited += len(content)
+        return content
+        
+    def chapter_elements(self, chapter_num):
+        """Return the top-level elements of a chapter, or None if the book lacks it."""
+        content = self.chapter_index.get(chapter_num)
+        if content is None and chapter_num in self.chapter_offsets:
+            content = self.parse_ranges(self.chapter_offsets.pop(chapter_num))
+            self.chapter_index[chapter_num] = content
+        return content
+        
+    def build_chapter_index(self):
+        """Index the top-level elements by chapter in a single pass over the book."""
+        self.front_content = []
+        self.chapter_index = {}
+        current = self.front_content
+        
+        for element in self.usx_content:
+            if element.tag == 'chapter':
+                if element.get('eid') is None:
+                    # Chapter start marker opens a new chapter slice
+                    current = self.chapter_index.setdefault(int(element.get('number')), [])
+                    current.append(element)
+                elif current is not None:
+                    # Chapter end marker closes the current slice
+                    current.append(element)
+                    current = None
+            elif current is not None:
+                current.append(element)
+                
+        self.log(f"Indexed {len(self.chapter_index)} chapters")
+        self.load_book_info(self.front_content)
+        
+    def load_book_info(self, front_content):
+        """Take the book code and title from the book element unless they were given."""
+        for element in front_content:
+            if element.tag == 'book':
+                if self.book_code is None:
+                    self.book_code = element.get('code')
+                if self.book_title is None:
+                    self.book_title = element.text or ''
+                break
+                
+        self.writer = USXWriter(self.book_code or '', self.book_title or '')
         
     def extract_chapter_content(self, chapter_num):
         """Extract all content for a specific chapter."""
-        chapter_content = []
-        in_target_chapter = False
-        found_start = False
+        chapter_content = self.chapter_elements(chapter_num)
         
-        for element in self.usx_content:
+        if chapter_content is None:
+            self.log(f"Warning: Chapter {chapter_num:02d} start marker not found")
+            return []
+                
+        return chapter_content
+    
+    def plan_chunks(self, chunks):
+        """Map the chunk starts of a normalized TOC entry to the verse ranges they cover."""
+        starts = [chunk for chunk in chunks if chunk != 'title']
+        plan = []
+        for i, start_verse in enumerate(starts):
+            # Each chunk runs up to the verse before the next chunk start
+            end_verse = starts[i + 1] - 1 if i + 1 < len(starts) else None
+            plan.append((start_verse, end_verse))
+        return plan
+    
+    def extract_chunks(self, chapter_content, plan):
+        """Distribute the verses of a chapter into chunk buckets in a single pass."""
+        starts = [start_verse for start_verse, _ in plan]
+        buckets = {start_verse: [] for start_verse in starts}
+        current = None
+        # Content before the chapter's first verse is held back until that
+        # verse tells which chunk it belongs to
+        lead = []
+        target = lead
+        visited = copied = 0
+
+        for element in chapter_content:
+            visited += 1
             if element.tag == 'chapter':
-                if element.get('number') == str(chapter_num) and element.get('eid') is None:
-                    # This is the start of our target chapter
-                    in_target_chapter = True
-                    found_start = True
-                    chapter_content.append(element)
-                elif element.get('number') != str(chapter_num) and in_target_chapter:
-                    # We've moved to a different chapter, stop collecting
-                    break
-                elif element.get('eid') is not None and in_target_chapter:
-                    # This is the end of our target chapter
-                    chapter_content.append(element)
-                    break
-            elif in_target_chapter:
-                # We're inside the target chapter, collect this element
-                chapter_content.append(element)
-        
-        if not found_start:
-            print(f"Warning: Chapter {chapter_num} start marker not found")
+                if element.get('eid') is None:
+                    # Chapter start marker - include in all chunks
+                    for chunk_content in buckets.values():
+                        chunk_content.append(element)
+                continue
+            if element.tag != 'para' or element.get('style') in TITLE_STYLES:
+                continue
+
+            para_copy = None
+            if target is not None and element.text and element.text.strip():
+                # Text before the first verse continues the previous verse
+                para_copy = ParagraphPiece(element, element.text)
+                target.append(para_copy)
+                copied += 1
+
+            visited += len(element)
+            for child in element:
+                if child.tag == 'verse' and child.get('number') is not None:
+                    chunk = self._chunk_for_verse(plan, starts, child.get('number'))
+                    if target is lead:
+                        # The lead-in goes with the first verse
+                        current = chunk
+                        target = None if chunk is None else buckets[chunk]
+                        if target is None:
+                            para_copy = None
+                        else:
+                            target.extend(lead)
+                    elif chunk != current:
+                        # The paragraph continues in another chunk
+                        current = chunk
+                        target = None if chunk is None else buckets[chunk]
+                        para_copy = None
+                if target is None:
+                    continue
+                if para_copy is None:
+                    para_copy = ParagraphPiece(element)
+                    target.append(para_copy)
+                    copied += 1
+                para_copy.append(child)
                 
-        return chapter_content
+        WORK_COUNTERS.elements_visited += visited
+        WORK_COUNTERS.paragraphs_copied += copied
+        return buckets
     
     def extract_verses_for_chunk(self, chapter_content, start_verse, end_verse=None):
         """Extract verses for a specific chunk within a chapter."""
         if end_verse is None:
             end_verse = start_verse
             
-        chunk_content = []
-        
-        for element in chapter_content:
-            if element.tag == 'para':
-                # Check if this paragraph contains verses in our range
-                verses_in_para = self.extract_verses_from_para(element, start_verse, end_verse)
-                if verses_in_para:
-                    chunk_content.append(verses_in_para)
-            elif element.tag == 'chapter' and element.get('eid') is None:
-                # Chapter start marker - include in all chunks
-                chunk_content.append(element)
-                
-        return chunk_content
-    
-    def extract_verses_from_para(self, para_element, start_verse, end_verse):
-        """Extract verses from a paragraph element that fall within the specified range."""
-        # Check if this paragraph contains any verses in our range
-        has_verses_in_range = False
-        for child in para_element:
-            if child.tag == 'verse':
-                verse_num = int(child.get('number', 0))
-                if start_verse <= verse_num <= end_verse:
-                    has_verses_in_range = True
-                    break
-                    
-        if not has_verses_in_range:
+        return self.extract_chunks(chapter_content, [(start_verse, end_verse)])[start_verse]
+    
+    def _chunk_for_verse(self, plan, starts, verse_number):
+        """Return the start verse of the chunk that holds a verse, or None."""
+        verse_num = self._verse_number(verse_number)
+        i = bisect.bisect_right(starts, verse_num) - 1
+        if i < 0:
             return None
-            
-        # Create a copy of the paragraph
-        para_copy = ET.Element(para_element.tag, para_element.attrib)
-        
-        # Process all text and elements within the paragraph
-        current_text = ""
-        for child in para_element:
-            if child.tag == 'verse':
-                verse_num = int(child.get('number', 0))
-                if start_verse <= verse_num <= end_verse:
-                    # This verse is in our range, include it
-                    para_copy.append(child)
-                    # Add any text that follows this verse
-                    if child.tail:
-                        current_text += child.tail
-            else:
-                # Other elements (like notes) - include if they're within our verse range
-                para_copy.append(child)
-                if child.tail:
-                    current_text += child.tail
-                    
-        # Add any remaining text
-        if para_element.text:
-            current_text = para_element.text + current_text
-            
-        if current_text.strip():
-            para_copy.text = current_text
-            
-        # Only return the paragraph if it has content
-        if len(para_copy) > 0 or (para_copy.text and para_copy.text.strip()):
-            return para_copy
-        return None
+        start_verse, end_verse = plan[i]
+        if end_verse is not None and verse_num > end_verse:
+            return None
+        return start_verse
     
-    def create_chunk_file(self, chapter_num, chunk_num, content, is_title=False):
+    @staticmethod
+    def _verse_number(verse_number):
+        """Parse a verse number, using the first verse of bridges such as '4-5'."""
+        match = re.match(r'\d+', verse_number)
+        return int(match.group()) if match else 0
+    
+    def create_chunk_file(self, chapter_num, chunk_num, content, is_title=False, toc_entry=None):
         """Create a USX file for a specific chunk."""
-        # Create chapter directory
-        chapter_dir = self.output_dir / f"{chapter_num:02d}"
-        chapter_dir.mkdir(parents=True, exist_ok=True)
-        
-        # Determine filename
+        # Determine filename within the chapter directory
         if is_title:
             filename = "title.usx"
         else:
             filename = f"{chunk_num:02d}.usx"
             
-        file_path = chapter_dir / filename
-        
-        # Create the USX document
-        usx_root = ET.Element('usx', version='3.0')
-        
-        # Add book information for non-title chunks
-        if not is_title:
-            book_info = ET.SubElement(usx_root, 'book', code='REV', style='id')
-            book_info.text = '- Biblica® Open Vietnamese Contemporary Bible 2015 (Biblica® Thiên Ban Kinh Thánh Hiện Đại)'
-        
-        # Add the content (including chapter markers if present)
-        for element in content:
-            if element is not None:
-                usx_root.append(element)
+        path = f"{chapter_num:02d}/{filename}"
         
         # Add chapter end marker for non-title chunks if not already present
+        chapter_end = None
         if not is_title:
             has_chapter_end = any(elem.tag == 'chapter' and elem.get('eid') for elem in content)
             if not has_chapter_end:
-                chapter_end = ET.SubElement(usx_root, 'chapter', eid=f'REV {chapter_num}')
+                chapter_end = f'{self.writer.book_code} {chapter_num}'
         
         # Write the file
-        tree = ET.ElementTree(usx_root)
-        self._indent_xml(usx_root)
-        tree.write(file_path, encoding='utf-8', xml_declaration=True)
+        if self.write_document(path, content, book=not is_title, chapter_end=chapter_end, toc_entry=toc_entry):
+            self.log(f"Created: {self.output_dir / path}")
+    
+    def write_document(self, path, content, book=False, chapter_end=None, toc_entry=None):
+        """Serialize and write one output document, unless the manifest shows it is unchanged.
+        
+        Returns whether the document was written.
+        """
+        key = None
+        if self.manifest is not None:
+            key = self.manifest.source_key(content, toc_entry, book and self.writer.book_line, chapter_end)
+            if self.manifest.is_current(path, key, self.sink):
+                return False
+                
+        self.sink.write(path, self.render_document(content, book=book, chapter_end=chapter_end))
+        if key is not None:
+            self.manifest.record(path, key)
+        return True
+        
+    def render_document(self, content, book=False, chapter_end=None):
+        """Return the bytes of an output document holding the given content."""
+        return self.writer.document(content, book=book, chapter_end=chapter_end)
         
-        print(f"Created: {file_path}")
+    def parse_chapter(self, chapter_info, chapter_data):
+        """Parse the serialized content of the chapter in chapter_info, as sent to a chapter worker."""
+        return list(self.backend.fromstring(chapter_data))
         
-    def process_chapter(self, chapter_info):
+    def process_chapter(self, chapter_info, chapter_content=None):
         """Process a single chapter according to the TOC structure."""
         chapter_num = chapter_info['chapter']
         chunks = chapter_info['chunks']
         
-        print(f"Processing chapter {chapter_num} with {len(chunks)} chunks")
+        self.log(f"Processing chapter {chapter_num:02d} with {len(chunks)} chunks")
         
-        # Extract all content for this chapter
-        chapter_content = self.extract_chapter_content(chapter_num)
+        # Extract all content for this chapter unless it was handed in
+        if chapter_content is None:
+            chapter_content = self.extract_chapter_content(chapter_num)
         
         if not chapter_content:
-            print(f"Warning: No content found for chapter {chapter_num}")
+            self.log(f"Warning: No content found for chapter {chapter_num:02d}")
             return
             
+        # Bucket the whole chapter into its chunks
+        # Only selected chunks are bucketed; their verse ranges still follow the whole TOC entry
+        selected = self.selected_chunks(chunks)
+        plan = [verse_range for verse_range in self.plan_chunks(chunks) if verse_range[0] in selected]
+        chunk_contents = self.extract_chunks(chapter_content, plan)
+        
         # Process each chunk
-        for i, chunk in enumerate(chunks):
+        for chunk in selected:
             if chunk == 'title':
                 # Create title file
                 title_content = self.extract_title_content(chapter_content)
-                self.create_chunk_file(int(chapter_num), 0, title_content, is_title=True)
+                self.create_chunk_file(chapter_num, 0, title_content, is_title=True, toc_entry=chapter_info)
             else:
                 # Create regular chunk file
-                chunk_num = int(chunk)
-                chunk_content = self.extract_verses_for_chunk(chapter_content, chunk_num)
-                self.create_chunk_file(int(chapter_num), chunk_num, chunk_content)
+                self.create_chunk_file(chapter_num, chunk, chunk_contents[chunk], toc_entry=chapter_info)
     
     def extract_title_content(self, chapter_content):
         """Extract title content for a chapter."""
         title_content = []
         
         for element in chapter_content:
-            if element.tag == 'para' and element.get('style') in ['s1', 's2', 's3', 'mt1', 'mt2', 'mt3']:
+            if element.tag == 'para' and element.get('style') in TITLE_STYLES:
                 title_content.append(element)
             elif element.tag == 'chapter' and element.get('eid') is None:
                 # Include chapter marker in title
                 title_content.append(element)
                 
+        WORK_COUNTERS.elements_visited += len(chapter_content)
         return title_content
     
-    def _indent_xml(self, elem, level=0):
-        """Add indentation to XML elements for better readability."""
-        i = "\n" + level * "  "
-        if len(elem):
-            if not elem.text or not elem.text.strip():
-                elem.text = i + "  "
-            if not elem.tail or not elem.tail.strip():
-                elem.tail = i
-            for child in elem:
-                self._indent_xml(child, level + 1)
-            if not child.tail or not child.tail.strip():
-                child.tail = i
-        else:
-            if level and (not elem.tail or not elem.tail.strip()):
-                elem.tail = i
-    
     def run(self):
         """Main execution method."""
-        print("Starting USX splitting process...")
+        self.log("Starting USX splitting process...")
         
         # Load data
         self.load_toc()
         self.load_usx()
         
-        # Create output directory
-        self.output_dir.mkdir(parents=True, exist_ok=True)
+        # Create output directory or archive
+        self.open_output()
+        try:
+            # Process each chapter
+            chapters = []
+            for chapter_info in self.toc_data:
+                if chapter_info['chapter'] == 'front':
+                    # Handle front matter
+                    self.process_front_matter(chapter_info)
+                elif self.jobs > 1:
+                    # Defer regular chapters to the worker pool
+                    chapters.append((chapter_info, self.chapter_for_worker(chapter_info['chapter'])))
+                else:
+                    # Handle regular chapters
+                    self.process_chapter(chapter_info)
+            
+            if chapters:
+                self.process_chapters_parallel(chapters)
+        finally:
+            self.close_output()
+        
+        self.log("USX splitting completed!")
+    
+    def iter_chunks(self):
+        """Yield a Chunk for every document the TOC describes, in TOC order, without writing anything.
+        
+        Chapters missing from the book yield no chunks.
+        """
+        if self.toc_data is None:
+            self.load_toc()
+        self.load_usx()
         
-        # Process each chapter
         for chapter_info in self.toc_data:
             if chapter_info['chapter'] == 'front':
-                # Handle front matter
-                self.process_front_matter(chapter_info)
+                yield from self.front_chunks(chapter_info)
+            else:
+                chapter_content = self.chapter_elements(chapter_info['chapter'])
+                if chapter_content:
+                    yield from self.chapter_chunks(chapter_info, chapter_content)
+    
+    def find_chunk(self, chapter, chunk, chapter_content=None):
+        """Return the Chunk of a single document of the loaded book, or None when the TOC or book lacks it.
+        
+        chapter is 'front' or a chapter number, and chunk is 'title' or a chunk
+        start verse. Only that document is extracted and rendered.
+        """
+        chapter_info = next((entry for entry in self.toc_data if entry['chapter'] == chapter), None)
+        if chapter_info is None or chunk not in chapter_info['chunks']:
+            return None
+        if chapter == 'front':
+            return next(self.front_chunks(chapter_info), None)
+            
+        if chapter_content is None:
+            chapter_content = self.chapter_elements(chapter)
+        if not chapter_content:
+            return None
+        if chunk == 'title':
+            return Chunk(chapter, 'title', None, self.render_document(self.extract_title_content(chapter_content)))
+            
+        verse_range = dict(self.plan_chunks(chapter_info['chunks']))[chunk]
+        content = self.extract_chunks(chapter_content, [(chunk, verse_range)])[chunk]
+        data = self.render_document(content, book=True, chapter_end=f'{self.writer.book_code} {chapter}')
+        return Chunk(chapter, chunk, (chunk, verse_range), data)
+    
+    def front_chunks(self, front_info):
+        """Yield the Chunk of the front title document, if the front matter has content for it."""
+        front_content = self.extract_front_content()
+        if front_content:
+            yield Chunk('front', 'title', None, self.render_document(front_content))
+    
+    def chapter_chunks(self, chapter_info, chapter_content):
+        """Yield the Chunks of one chapter, rendering each document only when it is asked for."""
+        chapter_num = chapter_info['chapter']
+        selected = self.selected_chunks(chapter_info['chunks'])
+        plan = [verse_range for verse_range in self.plan_chunks(chapter_info['chunks']) if verse_range[0] in selected]
+        verse_ranges = dict(plan)
+        chunk_contents = self.extract_chunks(chapter_content, plan)
+        chapter_end = f'{self.writer.book_code} {chapter_num}'
+        
+        for chunk in selected:
+            if chunk == 'title':
+                title_content = self.extract_title_content(chapter_content)
+                yield Chunk(chapter_num, 'title', None, self.render_document(title_content))
             else:
-                # Handle regular chapters
-                self.process_chapter(chapter_info)
+                data = self.render_document(chunk_contents[chunk], book=True, chapter_end=chapter_end)
+                yield Chunk(chapter_num, chunk, (chunk, verse_ranges[chunk]), data)
+    
+    def open_output(self):
+        """Open the output sink and, for incremental builds, the manifest of the previous run."""
+        self.sink.open()
+        self.manifest = None
+        if self.incremental and isinstance(self.sink, DirectorySink):
+            self.manifest = BuildManifest.load(self.output_dir)
+    
+    def close_output(self):
+        """Save the manifest and close the output sink."""
+        if self.manifest is not None:
+            self.manifest.save(self.output_dir)
+            self.log(f"Reused {self.manifest.reused} unchanged files")
+        self.sink.close()
+    
+    def worker_settings(self):
+        """Return the picklable settings a worker process needs to rebuild this splitter."""
+        return {
+            'usx_file_path': str(self.usx_file_path),
+            'usx_member': self.usx_member,
+            'toc_file_path': str(self.toc_file_path),
+            'output_dir': str(self.output_dir),
+            'backend': self.backend.name,
+            'book_code': self.book_code,
+            'book_title': self.book_title,
+            'chunks': self.chunks,
+            'collect_output': not self.sink.concurrent_writes,
+            'time_stages': self.stage_timer is not None,
+            'track_memory': self.memory_tracker is not None,
+            'profile': self.profiler.worker_settings() if self.profiler is not None else None,
+        }
+    
+    def chapter_for_worker(self, chapter_num):
+        """Return the content of a chapter that serialize_chapter turns into a worker's input."""
+        return self.chapter_elements(chapter_num) or []
+    
+    def serialize_chapter(self, chapter_content):
+        """Serialize the elements of a chapter to compact bytes for a worker process."""
+        return b''.join([b'<usx>'] + [self.backend.tostring(element) for element in chapter_content] + [b'</usx>'])
+    
+    def process_chapters_parallel(self, chapters):
+        """Process (chapter_info, chapter_content) pairs in a pool of worker processes.
         
-        print("USX splitting completed!")
+        Each worker receives its chapter as compact XML bytes. The log output of
+        every chapter is printed in the order the chapters were given, so it
+        matches a sequential run. When the sink cannot take concurrent writes,
+        workers return their files and they are written here in that same order.
+        """
+        settings = None
+        pending = deque()
+        
+        with ProcessPoolExecutor(max_workers=self.jobs) as executor:
+            for chapter_info, chapter_content in chapters:
+                if settings is None:
+                    # The book information is known once the front matter is loaded
+                    settings = self.worker_settings()
+                chapter_data = self.serialize_chapter(chapter_content)
+                previous = None
+                if self.manifest is not None:
+                    previous = self.manifest.subset(f"{chapter_info['chapter']:02d}/")
+                pending.append(executor.submit(_process_chapter_worker, settings, chapter_info, chapter_data, previous))
+                # Keep a bounded number of chapters in flight
+                if len(pending) > 2 * self.jobs:
+                    self._finish_chapter(pending.popleft().result())
+            while pending:
+                self._finish_chapter(pending.popleft().result())
+    
+    def _finish_chapter(self, result):
+        """Take over the files and results of a chapter worker and print its log."""
+        replay_entries(result['files'], self.sink)
+        if self.stage_timer is not None:
+            self.stage_timer.records.extend(result['stages'])
+        if self.memory_tracker is not None:
+            self.memory_tracker.merge(result['memory'])
+        if self.profiler is not None and result['profile'] not in self.profiler.worker_paths:
+            self.profiler.worker_paths.append(result['profile'])
+        if self.manifest is not None:
+            self.manifest.merge(result['manifest'], result['reused'])
+        self.log(result['log'], end='')
+    
+    def extract_front_content(self):
+        """Extract the front matter content that goes into the front title file."""
+        front_content = []
+        for element in self.front_content:
+            if element.tag in ['book', 'para'] and element.get('style') in FRONT_STYLES:
+                front_content.append(element)
+        return front_content
     
     def process_front_matter(self, front_info):
         """Process front matter (title page, etc.)."""
-        print("Processing front matter...")
+        self.log("Processing front matter...")
         
         # Create front directory
-        front_dir = self.output_dir / "front"
-        front_dir.mkdir(parents=True, exist_ok=True)
+        self.sink.add_directory("front")
         
         # Extract front matter content
-        front_content = []
-        for element in self.usx_content:
-            if element.tag in ['book', 'para'] and element.get('style') in ['h', 'toc1', 'toc2', 'toc3', 'mt1', 'mt2', 'mt3']:
-                front_content.append(element)
-            elif element.tag == 'chapter':
-                # Stop at first chapter
-                break
-                
+        front_content = self.extract_front_content()
+        
         # Create title file
         if front_content:
-            usx_root = ET.Element('usx', version='3.0')
-            for element in front_content:
-                usx_root.append(element)
+            if self.write_document("front/title.usx", front_content, toc_entry=front_info):
+                self.log(f"Created: {self.output_dir / 'front' / 'title.usx'}")
+
+
+class StreamingUSXSplitter(USXSplitter):
+    """USX splitter that parses the book incrementally, one chapter at a time.
+    
+    Each chapter is split as soon as its end marker has been parsed and its
+    elements are released afterwards, so peak memory is bounded by the largest
+    chapter instead of the whole file.
+    """
+    
+    def iter_chapters(self):
+        """Yield (chapter number, elements) for each chapter as soon as it is complete.
+        
+        The front matter before the first chapter is yielded with a chapter
+        number of None.
+        """
+        root = None
+        depth = 0
+        chapter_num = None
+        content = []
+        
+        with self.open_usx() as source:
+            for event, element in self.backend.iterparse(source, events=('start', 'end')):
+                if event == 'start':
+                    if root is None:
+                        root = element
+                    depth += 1
+                    continue
+                
+                depth -= 1
+                if depth != 1:
+                    continue
+                    
+                # A top-level element has been fully parsed
+                if element.tag == 'chapter' and element.get('eid') is None:
+                    if content is not None:
+                        # Front matter, or a previous chapter without an end marker
+                        yield chapter_num, content
+                    chapter_num = int(element.get('number'))
+                    content = [element]
+                elif content is not None:
+                    content.append(element)
+                    if element.tag == 'chapter':
+                        # Chapter end marker completes the chapter
+                        yield chapter_num, content
+                        content = None
+                        
+                # Detach parsed elements so they can be freed once processed
+                del root[:]
+            
+        if content is not None:
+            yield chapter_num, content
+    
+    def iter_toc_chapters(self, front_info, chapter_infos):
+        """Yield (chapter_info, chapter_content) for each parsed chapter listed in the TOC.
+        
+        Front matter is processed as soon as it has been parsed. Chapters that
+        are yielded are removed from chapter_infos.
+        """
+        for chapter_num, chapter_content in self.iter_chapters():
+            if chapter_num is None:
+                self.load_book_info(chapter_content)
+                if front_info is not None:
+                    self.front_content = chapter_content
+                    self.process_front_matter(front_info)
+                    self.front_content = []
+            elif chapter_num in chapter_infos:
+                yield chapter_infos.pop(chapter_num), chapter_content
+    
+    def iter_chunks(self):
+        """Yield a Chunk for every document the TOC describes, without writing anything.
+        
+        Chunks come in the order their chapters appear in the book, and each
+        chapter is released once its chunks have been yielded.
+        """
+        if self.toc_data is None:
+            self.load_toc()
+            
+        front_info = None
+        chapter_infos = {}
+        for chapter_info in self.toc_data:
+            if chapter_info['chapter'] == 'front':
+                front_info = chapter_info
+            else:
+                chapter_infos[chapter_info['chapter']] = chapter_info
+                
+        for chapter_num, chapter_content in self.iter_chapters():
+            if chapter_num is None:
+                self.load_book_info(chapter_content)
+                if front_info is not None:
+                    self.front_content = chapter_content
+                    yield from self.front_chunks(front_info)
+                    self.front_content = []
+            elif chapter_num in chapter_infos:
+                yield from self.chapter_chunks(chapter_infos.pop(chapter_num), chapter_content)
+    
+    def run(self):
+        """Main execution method."""
+        self.log("Starting streaming USX splitting process...")
+        
+        self.load_toc()
+        
+        front_info = None
+        chapter_infos = {}
+        for chapter_info in self.toc_data:
+            if chapter_info['chapter'] == 'front':
+                front_info = chapter_info
+            else:
+                chapter_infos[chapter_info['chapter']] = chapter_info
+        
+        # Process each chapter as it arrives from the parser
+        self.open_output()
+        try:
+            chapters = self.iter_toc_chapters(front_info, chapter_infos)
+            if self.jobs > 1:
+                self.process_chapters_parallel(chapters)
+            else:
+                for chapter_info, chapter_content in chapters:
+                    self.process_chapter(chapter_info, chapter_content)
+        finally:
+            self.close_output()
+        
+        for chapter_info in chapter_infos.values():
+            self.log(f"Warning: Chapter {chapter_info['chapter']:02d} start marker not found")
+        
+        self.log("USX splitting completed!")
+
+
+class MappedUSXSplitter(USXSplitter):
+    """USX splitter that cuts chunk files straight out of the memory-mapped source.
+    
+    The source is scanned once for the byte offsets of its top-level elements
+    and of the verse start markers in each paragraph; no element tree is
+    built. A chunk file is then the source bytes of its paragraphs, cut at
+    verse boundaries, inside minimal wrapper markup. Paragraph content keeps
+    the formatting of the source rather than being re-indented, so the files
+    are equivalent to, but not byte-identical with, those of the other
+    engines. Chapters are always split in a single process, and jobs is
+    ignored with a warning. The source must be UTF-8.
+    """
+    
+    # Source pages are mapped rather than held, and the offset index is compact
+    MEMORY_PER_SOURCE_BYTE = 6
+    
+    def load_usx(self):
+        """Map the USX file into memory and index the byte offsets of its chapters."""
+        with self.open_usx() as source:
+            self.usx_data = _map_usx(source, 'mmap')
+        self.log(f"Mapped USX file: {len(self.usx_data)} bytes")
+        self.build_chapter_index()
+    
+    def close_usx(self):
+        """Release the mapped source."""
+        if isinstance(self.usx_data, mmap.mmap):
+            self.usx_data.close()
+        self.usx_data = None
+    
+    def iter_top_level(self):
+        """Yield the top-level elements of the source as offset tuples.
+        
+        Each tuple is (tag, attributes, start, content start, content end, end,
+        verses), where the content offsets are None for empty elements and
+        verses lists the (offset, number) of each verse start marker directly
+        inside the element.
+        """
+        data = self.usx_data
+        depth = 0
+        opened = None
+        scanned = 0
+        
+        for match in XML_TAG_PATTERN.finditer(data):
+            scanned += 1
+            closing, name, attributes, empty = match.groups()
+            if name is None:
+                continue
+            if closing:
+                depth -= 1
+                if depth == 1 and opened is not None:
+                    tag, attrib, start, content_start, verses = opened
+                    yield tag, attrib, start, content_start, match.start(), match.end(), verses
+                    opened = None
+                continue
+                
+            if depth == 1:
+                tag = name.decode('utf-8')
+                attrib = _scan_attributes(attributes)
+                if empty:
+                    yield tag, attrib, match.start(), None, None, match.end(), []
+                else:
+                    opened = (tag, attrib, match.start(), match.end(), [])
+            elif depth == 2 and name == b'verse' and opened is not None:
+                number = _scan_attributes(attributes).get('number')
+                if number is not None:
+                    opened[4].append((match.start(), number))
+            if not empty:
+                depth += 1
+                
+        WORK_COUNTERS.elements_visited += scanned
+    
+    def build_chapter_index(self):
+        """Index the offsets of the top-level elements by chapter in a single scan of the book."""
+        self.front_content = []
+        self.chapter_index = {}
+        current = self.front_content
+        
+        for item in self.iter_top_level():
+            tag, attrib = item[0], item[1]
+            if tag == 'chapter':
+                if 'eid' not in attrib:
+                    # Chapter start marker opens a new chapter slice
+                    current = self.chapter_index.setdefault(int(attrib['number']), [])
+                    current.append(item)
+                elif current is not None:
+                    # Chapter end marker closes the current slice
+                    current.append(item)
+                    current = None
+            elif current is not None:
+                current.append(item)
+                
+        self.log(f"Indexed {len(self.chapter_index)} chapters")
+        book = [self.backend.fromstring(self.usx_data[item[2]:item[5]])
+                for item in self.front_content if item[0] == 'book']
+        self.load_book_info(book)
+    
+    def extract_chunks(self, chapter_content, plan):
+        """Distribute the byte ranges of a chapter's verses into chunk buckets in a single pass."""
+        data = self.usx_data
+        starts = [start_verse for start_verse, _ in plan]
+        buckets = {start_verse: [] for start_verse in starts}
+        current = None
+        # Pieces before the chapter's first verse, held until it is reached
+        lead = []
+        visited = copied = 0
+
+        for tag, attrib, start, content_start, content_end, end, verses in chapter_content:
+            visited += 1 + len(verses)
+            if tag == 'chapter':
+                if 'eid' not in attrib:
+                    # Chapter start marker - include in all chunks
+                    marker = data[start:end]
+                    for chunk_content in buckets.values():
+                        chunk_content.append(marker)
+                continue
+            if tag != 'para' or attrib.get('style') in TITLE_STYLES or content_start is None:
+                continue
+                
+            # Cut the paragraph where a verse moves it into another chunk;
+            # content before the first verse continues the previous verse
+            start_tag = data[start:content_start]
+            end_tag = f'</{tag}>'.encode('utf-8')
+            cuts = []
+            run_start = content_start
+            for offset, number in verses:
+                chunk = self._chunk_for_verse(plan, starts, number)
+                if lead is not None:
+                    # The lead-in goes with the first verse
+                    if chunk is not None:
+                        buckets[chunk].extend(lead)
+                    lead = None
+                    current = chunk
+                elif chunk != current:
+                    cuts.append((current, run_start, offset))
+                    current = chunk
+                    run_start = offset
+            cuts.append((current, run_start, content_end))
+
+            for i, (chunk, cut_start, cut_end) in enumerate(cuts):
+                if lead is not None:
+                    target = lead
+                elif chunk is None:
+                    continue
+                else:
+                    target = buckets[chunk]
+                piece = data[cut_start:cut_end]
+                if i == 0 and cut_start == content_start and not piece.strip():
+                    continue
+                target.append(start_tag + piece + end_tag)
+                copied += 1
+                
+        WORK_COUNTERS.elements_visited += visited
+        WORK_COUNTERS.paragraphs_copied += copied
+        return buckets
+    
+    def extract_title_content(self, chapter_content):
+        """Extract the source bytes of the title content for a chapter."""
+        data = self.usx_data
+        title_content = []
+        
+        for tag, attrib, start, _, _, end, _ in chapter_content:
+            if tag == 'para' and attrib.get('style') in TITLE_STYLES:
+                title_content.append(data[start:end])
+            elif tag == 'chapter' and 'eid' not in attrib:
+                # Include chapter marker in title
+                title_content.append(data[start:end])
+                
+        WORK_COUNTERS.elements_visited += len(chapter_content)
+        return title_content
+    
+    def create_chunk_file(self, chapter_num, chunk_num, content, is_title=False, toc_entry=None):
+        """Create a USX file for a specific chunk from its source bytes."""
+        filename = "title.usx" if is_title else f"{chunk_num:02d}.usx"
+        path = f"{chapter_num:02d}/{filename}"
+        chapter_end = None if is_title else f'{self.writer.book_code} {chapter_num}'
+        
+        if self.write_document(path, content, book=not is_title, chapter_end=chapter_end, toc_entry=toc_entry):
+            self.log(f"Created: {self.output_dir / path}")
+    
+    def render_document(self, content, book=False, chapter_end=None):
+        """Return the bytes of an output document made of the given source bytes."""
+        return self.writer.assemble(content, book=book, chapter_end=chapter_end)
+    
+    def write_document(self, path, content, book=False, chapter_end=None, toc_entry=None):
+        """Assemble and write one output document from source bytes, unless the manifest shows it is unchanged.
+        
+        Returns whether the document was written.
+        """
+        data = self.render_document(content, book=book, chapter_end=chapter_end)
+        key = None
+        if self.manifest is not None:
+            key = self.manifest.data_key(data, toc_entry)
+            if self.manifest.is_current(path, key, self.sink):
+                return False
+                
+        self.sink.write(path, data)
+        if key is not None:
+            self.manifest.record(path, key)
+        return True
+    
+    def extract_front_content(self):
+        """Extract the source bytes of the front matter content that goes into the front title file."""
+        front_content = []
+        for tag, attrib, start, _, _, end, _ in self.front_content:
+            if tag in ['book', 'para'] and attrib.get('style') in FRONT_STYLES:
+                front_content.append(self.usx_data[start:end])
+        return front_content
+    
+    def iter_chunks(self):
+        """Yield a Chunk for every document the TOC describes, in TOC order, without writing anything."""
+        try:
+            yield from super().iter_chunks()
+        finally:
+            self.close_usx()
+    
+    def run(self):
+        """Main execution method."""
+        # Chunks are copied from the source without parsing it, which leaves
+        # nothing worth spreading across worker processes
+        if self.jobs > 1:
+            self.log(f"Warning: The mmap engine splits in a single process, ignoring jobs={self.jobs}")
+            self.jobs = 1
+        try:
+            super().run()
+        finally:
+            self.close_usx()
+
+
+class LazyUSXSplitter(USXSplitter):
+    """USX splitter that parses only the chapters it processes.
+    
+    Loading the book searches its bytes for chapter markers instead of parsing
+    it. Each chapter's byte range is parsed inside a synthetic root when the
+    chapter is processed and released afterwards, so with a chapter selection
+    the parse cost follows the chapters actually converted. Worker processes
+    are sent the unparsed bytes of their chapters. The source must be UTF-8.
+    """
+    
+    def load_usx(self):
+        """Map the USX file into memory and find the byte ranges of its chapters."""
+        with self.open_usx() as source:
+            usx_data = _map_usx(source, 'lazy')
+        self.load_offsets(usx_data, *scan_chapter_offsets(usx_data))
+    
+    def close_usx(self):
+        """Release the mapped source."""
+        if isinstance(self.usx_data, mmap.mmap):
+            self.usx_data.close()
+        self.usx_data = None
+    
+    def chapter_elements(self, chapter_num):
+        """Parse and return the top-level elements of a chapter, or None if the book lacks it."""
+        ranges = self.chapter_offsets.get(chapter_num)
+        if ranges is None:
+            return None
+        return self.parse_ranges(ranges)
+    
+    def chapter_for_worker(self, chapter_num):
+        """Return the byte ranges of a chapter, which are sent to a worker unparsed."""
+        return self.chapter_offsets.get(chapter_num, [])
+    
+    def serialize_chapter(self, chapter_content):
+        """Wrap the source bytes of a chapter, given as byte ranges, in a synthetic root."""
+        return _join_ranges(self.usx_data, chapter_content)
+    
+    def iter_chunks(self):
+        """Yield a Chunk for every document the TOC describes, in TOC order, without writing anything."""
+        try:
+            yield from super().iter_chunks()
+        finally:
+            self.close_usx()
+    
+    def run(self):
+        """Main execution method."""
+        try:
+            super().run()
+        finally:
+            self.close_usx()
+
+
+ENGINES = {
+    'dom': USXSplitter,
+    'stream': StreamingUSXSplitter,
+    'mmap': MappedUSXSplitter,
+    'lazy': LazyUSXSplitter,
+}
+
+
+def _discard_log(*args, **kwargs):
+    """Drop a progress message, for splitters used as a library."""
+
+
+def split(usx_source, toc, engine='dom', backend=None, book_code=None, book_title=None, usx_member=None):
+    """Split a USX book and lazily yield its documents as Chunks, without touching the output filesystem.
+    
+    usx_source is a path, a binary file object, or the USX bytes themselves;
+    with usx_member it is a zip archive holding the book. toc is a path to a
+    TOC file or an already loaded TOC list. engine names the splitter of
+    ENGINES to use. Each document is rendered only when the iterator reaches
+    it. The splitter's progress messages are not printed.
+    """
+    if isinstance(usx_source, (bytes, bytearray)):
+        usx_source = io.BytesIO(usx_source)
+    toc_file_path = toc
+    toc_data = None
+    if isinstance(toc, list):
+        toc_file_path = None
+        toc_data = normalize_toc(toc)
+        
+    splitter = ENGINES[engine](usx_source, toc_file_path, None, backend=backend or get_backend(),
+                               book_code=book_code, book_title=book_title, usx_member=usx_member,
+                               log=_discard_log)
+    splitter.toc_data = toc_data
+    yield from splitter.iter_chunks()
+
+
+class Book:
+    """Random access to the chapters and chunks of a USX book.
+    
+    Opening a book only searches its bytes for chapter markers. A chapter is
+    parsed the first time it is asked for, as book[3], and the max_chapters
+    most recently used chapters are kept parsed. Chunks are rendered one at a
+    time with book.chunk(3, 7), exactly as the files of a full split, which
+    needs a TOC: a path to a TOC file or an already loaded TOC list.
+    """
+    
+    def __init__(self, usx_file_path, toc=None, book_code=None, book_title=None, usx_member=None,
+                 max_chapters=16):
+        toc_file_path = toc if toc is not None and not isinstance(toc, list) else None
+        self.splitter = LazyUSXSplitter(usx_file_path, toc_file_path, None, backend=get_backend(),
+                                        book_code=book_code, book_title=book_title, usx_member=usx_member,
+                                        log=_discard_log)
+        self.max_chapters = max_chapters
+        self.parsed = OrderedDict()
+        
+        if isinstance(toc, list):
+            self.splitter.toc_data = normalize_toc(toc)
+        if toc_file_path is not None:
+            self.splitter.load_toc()
+        self.splitter.load_usx()
+        self.front = self.splitter.front_content
+        self.offsets = self.splitter.chapter_offsets
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def close(self):
+        """Release the source and the parsed chapters."""
+        self.splitter.close_usx()
+        self.parsed.clear()
+    
+    def chapters(self):
+        """Return the numbers of the book's chapters in ascending order."""
+        return sorted(self.offsets)
+    
+    def __len__(self):
+        return len(self.offsets)
+    
+    def __contains__(self, chapter_num):
+        return chapter_num in self.offsets
+    
+    def __getitem__(self, chapter_num):
+        """Return the top-level elements of a chapter, parsing it on first use."""
+        content = self.parsed.get(chapter_num)
+        if content is None:
+            content = self.splitter.chapter_elements(chapter_num)
+            if content is None:
+                raise KeyError(chapter_num)
+            self.parsed[chapter_num] = content
+            if len(self.parsed) > self.max_chapters:
+                self.parsed.popitem(last=False)
+        self.parsed.move_to_end(chapter_num)
+        return content
+    
+    def chunk(self, chapter, chunk):
+        """Return the Chunk of one document, or None when the TOC or book lacks it.
+        
+        chapter is 'front' or a chapter number, and chunk is 'title' or a chunk
+        start verse.
+        """
+        if self.splitter.toc_data is None:
+            raise ValueError("Chunks can only be looked up in a book opened with a TOC")
+        if chapter != 'front' and chapter not in self.offsets:
+            return None
+        chapter_content = self[chapter] if chapter != 'front' else None
+        return self.splitter.find_chunk(chapter, chunk, chapter_content)
+
+
+
+def _check_source_book(front_content, expected_book):
+    """Raise ValueError when the book element of the front matter names another book than expected_book."""
+    source_book = next((element.get('code') for element in front_content if element.tag == 'book'), None)
+    if expected_book is not None and source_book != expected_book:
+        raise ValueError(f"The USX file holds book {source_book}, not {expected_book}")
+
+
+def extract_chunk(usx_file_path, toc_file_path, chapter, chunk, book_code=None, book_title=None,
+                  usx_member=None, cache=None, expected_book=None):
+    """Extract and render a single document of a book, or return None when the TOC or book lacks it.
+    
+    chapter is 'front' or a chapter number, and chunk is 'title' or a chunk
+    start verse. Without a cache, only the chapter markers of the book are
+    searched for and only the chapter holding the chunk is parsed; with a
+    ParseCache, the byte ranges of the book's chapters come from the cache
+    and only that chapter is parsed. With expected_book, a ValueError is raised when the
+    USX file's book element has another code. The splitter's progress
+    messages are not printed.
+    """
+    if cache is None:
+        with Book(usx_file_path, toc_file_path, book_code=book_code, book_title=book_title,
+                  usx_member=usx_member, max_chapters=1) as book:
+            _check_source_book(book.front, expected_book)
+            return book.chunk(chapter, chunk)
+            
+    splitter = USXSplitter(usx_file_path, toc_file_path, None, backend=get_backend(),
+                           book_code=book_code, book_title=book_title, usx_member=usx_member, cache=cache,
+                           chapters=Selection(str(chapter), names=('front',)), log=_discard_log)
+    splitter.load_toc()
+    splitter.load_usx()
+    _check_source_book(splitter.front_content, expected_book)
+    return splitter.find_chunk(chapter, chunk)
+
+
+class BookCache:
+    """LRU cache of loaded books for serving single chunks, bounded by a memory budget.
+    
+    books maps book codes to (USX path, zip member, TOC path). A book is
+    loaded on first use and kept until its USX or TOC file changes: a changed
+    mtime or size triggers a content hash check, and only a changed hash
+    reloads the book. The memory of a book is estimated from the size of its
+    source, and least recently used books are dropped once the estimates add
+    up to more than max_bytes.
+    """
+    
+    def __init__(self, books, engine='dom', max_bytes=512 * 1024 * 1024):
+        self.books = books
+        self.engine = engine
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+    
+    def get(self, book_code):
+        """Return the loaded splitter of a book, or None for an unknown book code."""
+        if book_code not in self.books:
+            return None
+        usx_path, usx_member, toc_path = self.books[book_code]
+        stamps = (self._stamp(usx_path), self._stamp(toc_path))
+        
+        entry = self.entries.get(book_code)
+        if entry is not None and entry['stamps'] != stamps:
+            # The files were touched; reload only when their content changed
+            usx_digest = hashlib.sha256(self._read_usx(usx_path, usx_member)).hexdigest()
+            if entry['digests'] == (usx_digest, self._digest(toc_path)):
+                entry['stamps'] = stamps
+            else:
+                self._drop(book_code)
+                entry = None
+                
+        if entry is None:
+            entry = self._load(book_code, stamps)
+        self.entries.move_to_end(book_code)
+        return entry['splitter']
+    
+    def _load(self, book_code, stamps):
+        usx_path, usx_member, toc_path = self.books[book_code]
+        data = self._read_usx(usx_path, usx_member)
+        
+        splitter = ENGINES[self.engine](io.BytesIO(data), toc_path, None, backend=get_backend(),
+                                        log=_discard_log)
+        splitter.load_toc()
+        splitter.load_usx()
+        entry = {
+            'splitter': splitter,
+            'stamps': stamps,
+            'digests': (hashlib.sha256(data).hexdigest(), self._digest(toc_path)),
+            'size': len(data) * splitter.MEMORY_PER_SOURCE_BYTE,
+        }
+        self.entries[book_code] = entry
+        self.total_bytes += entry['size']
+        
+        # Keep at least the book just loaded, even when it alone is over budget
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            self._drop(next(iter(self.entries)))
+        return entry
+    
+    def _drop(self, book_code):
+        entry = self.entries.pop(book_code)
+        self.total_bytes -= entry['size']
+        if hasattr(entry['splitter'], 'close_usx'):
+            entry['splitter'].close_usx()
+    
+    @staticmethod
+    def _stamp(path):
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+    
+    @staticmethod
+    def _digest(path):
+        return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+    
+    @staticmethod
+    def _read_usx(usx_path, usx_member):
+        if usx_member is None:
+            return Path(usx_path).read_bytes()
+        with zipfile.ZipFile(usx_path) as archive:
+            return archive.read(usx_member)
+
+
+class SplitRequestHandler(BaseHTTPRequestHandler):
+    """Answer GET /<book code>/<chapter>/<chunk> with the USX of one chunk.
+    
+    The chapter is a number or 'front', and the chunk a start verse or
+    'title', optionally followed by .usx: /REV/03/07 or /REV/front/title.usx.
+    """
+    
+    def do_GET(self):
+        parts = self.path.split('?', 1)[0].strip('/').split('/')
+        if len(parts) != 3:
+            self.send_error(400, "Expected /<book>/<chapter>/<chunk>")
+            return
+        book_code, chapter, chunk = parts
+        chunk = chunk[:-len('.usx')] if chunk.endswith('.usx') else chunk
+        if not (chapter == 'front' or chapter.isdigit()) or not (chunk == 'title' or chunk.isdigit()):
+            self.send_error(400, "Chapter must be a number or 'front', chunk a number or 'title'")
+            return
+            
+        try:
+            splitter = self.server.books.get(book_code)
+            found = None
+            if splitter is not None:
+                found = splitter.find_chunk(chapter if chapter == 'front' else int(chapter),
+                                            chunk if chunk == 'title' else int(chunk))
+        except Exception as e:
+            self.send_error(500, f"Could not load {book_code}: {e}")
+            return
+        if found is None:
+            self.send_error(404, f"No chunk {chunk} in {book_code} {chapter}")
+            return
+            
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/xml; charset=utf-8')
+        self.send_header('Content-Length', str(len(found.data)))
+        self.end_headers()
+        self.wfile.write(found.data)
+
+
+def serve(books, host='127.0.0.1', port=8000, engine='dom', max_bytes=512 * 1024 * 1024):
+    """Serve single chunks of (book code, USX path, zip member, TOC path) books over HTTP until interrupted."""
+    server = HTTPServer((host, port), SplitRequestHandler)
+    server.books = BookCache({book_code: (usx_path, usx_member, toc_path)
+                              for book_code, usx_path, usx_member, toc_path in books},
+                             engine=engine, max_bytes=max_bytes)
+    print(f"Serving {len(books)} books on http://{server.server_address[0]}:{server.server_address[1]}/")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+# A chapter worker returns a dict of its 'log' output, the (path, data)
+# 'files' it made when the parent's sink cannot take concurrent writes, its
+# 'manifest' entries and 'reused' count, and the 'stages' records, 'memory'
+# export and 'profile' path the parent asked for, or empty values
+def _process_chapter_worker(settings, chapter_info, chapter_data, previous_manifest):
+    """Split one serialized chapter in a worker process and return its result dict.
+    
+    previous_manifest holds the chapter's entries from the previous run, or is
+    None when the build is not incremental.
+    """
+    settings = dict(settings)
+    sink = MemorySink() if settings.pop('collect_output') else DirectorySink(settings['output_dir'])
+    stage_timer = StageTimer() if settings.pop('time_stages') else None
+    memory_tracker = MemoryTracker(f"worker {os.getpid()}") if settings.pop('track_memory') else None
+    profile = settings.pop('profile')
+    profiler = _profile_worker(profile) if profile is not None else None
+    output = io.StringIO()
+    splitter = USXSplitter(**dict(settings, backend=get_backend(settings['backend']), sink=sink,
+                                  log=functools.partial(print, file=output)))
+    splitter.load_book_info([])
+    if stage_timer is not None:
+        stage_timer.instrument(splitter)
+    if memory_tracker is not None:
+        memory_tracker.instrument(splitter)
+        # A forked worker keeps tracing from its parent; others start here and keep tracing
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+    if previous_manifest is not None:
+        splitter.manifest = BuildManifest(previous_manifest)
+        
+    with profiler or contextlib.nullcontext():
+        chapter_content = splitter.parse_chapter(chapter_info, chapter_data)
+        splitter.process_chapter(chapter_info, chapter_content or None)
+    profile_path = _save_worker_profile(profiler)
+        
+    manifest = splitter.manifest or BuildManifest()
+    return {
+        'log': output.getvalue(),
+        'files': getattr(sink, 'entries', []),
+        'manifest': manifest.entries,
+        'reused': manifest.reused,
+        'stages': stage_timer.records if stage_timer is not None else [],
+        'memory': memory_tracker.export() if memory_tracker is not None else None,
+        'profile': profile_path,
+    }
+
+
+def make_cache(cache_dir, cache_size=None):
+    """Return a ParseCache in cache_dir capped at cache_size bytes, or None without a cache_dir."""
+    if cache_dir is None:
+        return None
+    if cache_size is None:
+        return ParseCache(cache_dir)
+    return ParseCache(cache_dir, cache_size)
+
+
+def find_release_books(release_path, toc_dir):
+    """Pair every USX book of a DBL release with its TOC file.
+    
+    The release can be a directory or a zip archive. Books are read from its
+    USX_1 directory, or from the release directory itself when it has none.
+    The TOC of a book is looked up as <CODE>.yml or <CODE>/toc.yml in toc_dir,
+    in upper or lower case. Returns a list of (book code, USX path, zip member,
+    TOC path) tuples, where the zip member is None for plain files; books
+    without a TOC are skipped.
+    """
+    toc_dir = Path(toc_dir)
+    books = []
+    for book_code, usx_path, usx_member in _iter_release_usx(release_path):
+        toc_path = _find_toc(toc_dir, book_code)
+        if toc_path is None:
+            print(f"Warning: No TOC found for {book_code}, skipping")
+            continue
+        books.append((book_code, usx_path, usx_member, toc_path))
+    return books
+
+
+def _iter_release_usx(release_path):
+    """Yield (book code, USX path, zip member) for each USX book of a release."""
+    release_path = Path(release_path)
+    if zipfile.is_zipfile(release_path):
+        with zipfile.ZipFile(release_path) as archive:
+            members = [PurePosixPath(name) for name in archive.namelist() if name.endswith('.usx')]
+        in_usx_1 = [member for member in members if member.parent.name == 'USX_1']
+        for member in sorted(in_usx_1 or members):
+            yield member.stem, release_path, str(member)
+        return
+        
+    usx_dir = release_path / 'USX_1'
+    if not usx_dir.is_dir():
+        usx_dir = release_path
+    for usx_path in sorted(usx_dir.glob('*.usx')):
+        yield usx_path.stem, usx_path, None
+
+
+def _book_size(usx_path, usx_member):
+    """Return the uncompressed size of a USX book in bytes."""
+    if usx_member is None:
+        return os.path.getsize(usx_path)
+    with zipfile.ZipFile(usx_path) as archive:
+        return archive.getinfo(usx_member).file_size
+
+
+def _find_toc(toc_dir, book_code):
+    """Return the TOC file for a book code in toc_dir, or None."""
+    for name in (book_code, book_code.upper(), book_code.lower()):
+        for candidate in (toc_dir / f"{name}.yml", toc_dir / name / "toc.yml"):
+            if candidate.is_file():
+                return candidate
+    return None
+
+
+def split_books(books, output_dir, jobs=1, backend='auto', engine='dom', archive=None, incremental=True,
+                cache_dir=None, cache_size=None, profiler=None, stage_timer=None, memory_tracker=None):
+    """Split (book code, USX path, zip member, TOC path) books into <output_dir>/<book code>.
+    
+    With archive set to an extension such as 'zip' or 'tar.gz', each book is
+    written to <output_dir>/<book code>.<archive> instead. engine names the
+    splitter of ENGINES to use: 'dom', 'stream', 'lazy' or 'mmap'. With
+    cache_dir set, parsed TOCs are shared through a ParseCache there. Books are scheduled across a pool of worker processes, largest
+    first, and each book's log is printed as it finishes. A Profiler,
+    StageTimer or MemoryTracker also covers the workers, with the chapters
+    of their records prefixed by the book code. Returns the codes of the
+    books that failed.
+    """
+    books = sorted(books, key=lambda book: _book_size(book[1], book[2]), reverse=True)
+    tasks = []
+    for book_code, usx_path, usx_member, toc_path in books:
+        book_output = _book_output(output_dir, book_code, archive)
+        tasks.append((book_code, (str(usx_path), usx_member, str(toc_path), book_output, backend, engine,
+                                  incremental, cache_dir, cache_size)))
+    return _run_book_workers(tasks, jobs, profiler, stage_timer, memory_tracker)
+
+
+def find_multibook_books(usx_file_path, toc_dir):
+    """Find the books of a multi-book USX file and pair each with its TOC file.
+    
+    The file is searched for book elements without being parsed. TOCs are
+    looked up as for find_release_books. Returns a list of (book code, USX
+    path, segment, TOC path) tuples, where the segment holds the root tags
+    and the byte range of the book for split_multibook; books without a TOC
+    are skipped.
+    """
+    with open(usx_file_path, 'rb') as source:
+        data = _map_usx(source, 'multi-book')
+    try:
+        root_start, root_end, book_ranges = scan_book_offsets(data)
+    finally:
+        if isinstance(data, mmap.mmap):
+            data.close()
             
-            tree = ET.ElementTree(usx_root)
-            self._indent_xml(usx_root)
-            tree.write(front_dir / "title.usx", encoding='utf-8', xml_declaration=True)
-            print(f"Created: {front_dir / 'title.usx'}")
+    toc_dir = Path(toc_dir)
+    books = []
+    seen = set()
+    for book_code, start, end in book_ranges:
+        if book_code in seen:
+            print(f"Warning: Duplicate book {book_code}, skipping")
+            continue
+        seen.add(book_code)
+        toc_path = _find_toc(toc_dir, book_code)
+        if toc_path is None:
+            print(f"Warning: No TOC found for {book_code}, skipping")
+            continue
+        books.append((book_code, usx_file_path, (root_start, root_end, start, end), toc_path))
+    return books
+
+
+def split_multibook(books, output_dir, jobs=1, backend='auto', engine='dom', archive=None, incremental=True,
+                    cache_dir=None, cache_size=None, profiler=None, stage_timer=None,
+                    memory_tracker=None):
+    """Split the (book code, USX path, segment, TOC path) books of find_multibook_books.
+    
+    Each worker process reads and parses only its own book's byte range of
+    the file, then splits that book, so parsing runs on as many cores as
+    splitting. Options and the return value are as for split_books.
+    """
+    books = sorted(books, key=lambda book: book[2][3] - book[2][2], reverse=True)
+    tasks = []
+    for book_code, usx_path, segment, toc_path in books:
+        book_output = _book_output(output_dir, book_code, archive)
+        tasks.append((book_code, (str(usx_path), None, str(toc_path), book_output, backend, engine,
+                                  incremental, cache_dir, cache_size, segment)))
+    return _run_book_workers(tasks, jobs, profiler, stage_timer, memory_tracker)
+
+
+def _book_output(output_dir, book_code, archive):
+    """Return the output directory or archive path of a book."""
+    return str(Path(output_dir) / (f"{book_code}.{archive}" if archive else book_code))
+
+
+def _run_book_workers(tasks, jobs, profiler=None, stage_timer=None, memory_tracker=None):
+    """Run (book code, arguments) tasks of _split_book_worker in a process pool and return the failed codes."""
+    profile = profiler.worker_settings() if profiler is not None else None
+    failed = []
+    
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {}
+        for book_code, arguments in tasks:
+            future = executor.submit(_split_book_worker, *arguments, profile=profile,
+                                     time_stages=stage_timer is not None,
+                                     track_memory=memory_tracker is not None)
+            futures[future] = book_code
+        for future in as_completed(futures):
+            result = future.result()
+            if profiler is not None and result['profile'] not in profiler.worker_paths:
+                profiler.worker_paths.append(result['profile'])
+            if stage_timer is not None:
+                stage_timer.merge(result['stages'], label=futures[future])
+            if memory_tracker is not None:
+                memory_tracker.merge(result['memory'], label=futures[future])
+            print(f"Book {futures[future]}:")
+            print(result['log'], end='')
+            if not result['succeeded']:
+                failed.append(futures[future])
+                
+    return failed
+
+
+# A book worker returns a dict of whether the book 'succeeded', its 'log'
+# output, and the worker's 'profile' path, the book's 'stages' records and
+# its 'memory' export, or empty values when the parent did not ask for them
+def _split_book_worker(usx_file_path, usx_member, toc_file_path, output_dir, backend, engine, incremental,
+                       cache_dir, cache_size, segment=None, profile=None, time_stages=False,
+                       track_memory=False):
+    """Split one book in a worker process and return its result dict.
+    
+    With a (root start tag, root end tag, start, end) segment, the book is
+    that byte range of a multi-book USX file. profile holds the
+    Profiler.worker_settings of a profiled parent.
+    """
+    splitter_class = ENGINES[engine]
+    profiler = _profile_worker(profile) if profile is not None else None
+    stage_timer = StageTimer() if time_stages else None
+    memory_tracker = MemoryTracker() if track_memory else None
+    succeeded = True
+    output = io.StringIO()
+    log = functools.partial(print, file=output)
+    with profiler or contextlib.nullcontext():
+        with memory_tracker or contextlib.nullcontext():
+            try:
+                usx_source = usx_file_path
+                if segment is not None:
+                    root_start, root_end, start, end = segment
+                    with open(usx_file_path, 'rb') as f:
+                        f.seek(start)
+                        usx_source = io.BytesIO(root_start + f.read(end - start) + root_end)
+                splitter = splitter_class(usx_source, toc_file_path, output_dir,
+                                          backend=get_backend(backend), usx_member=usx_member,
+                                          incremental=incremental, cache=make_cache(cache_dir, cache_size),
+                                          log=log)
+                if stage_timer is not None:
+                    stage_timer.instrument(splitter)
+                if memory_tracker is not None:
+                    memory_tracker.instrument(splitter)
+                splitter.run()
+            except Exception as e:
+                log(f"Error during conversion of {usx_member or usx_file_path}: {e}")
+                succeeded = False
+    return {
+        'succeeded': succeeded,
+        'log': output.getvalue(),
+        'profile': _save_worker_profile(profiler),
+        'stages': stage_timer.records if stage_timer is not None else [],
+        'memory': memory_tracker.export() if memory_tracker is not None else None,
+    }
+
+
+def _save_worker_profile(profiler):
+    """Save a worker's profile, if it has one, and return its path or None."""
+    if profiler is None:
+        return None
+    # Workers are not told when the pool shuts down, so save after every task
+    profiler.save()
+    return str(profiler.path)
 
 
 def main():
@@ -288,7 +2994,8 @@ def main():
     args = parser.parse_args()
     
     # Create splitter and run
-    splitter = USXSplitter(args.usx_file, args.toc_file, args.output_dir)
+    splitter = USXSplitter(args.usx_file, args.toc_file, args.output_dir,
+                           book_code=args.book_code, book_title=args.book_title)
     splitter.run()
 
 